@@ -1,6 +1,6 @@
 
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -26,10 +26,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'main.routers.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main.access.AccessScopeMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -55,11 +57,79 @@ TEMPLATES = [
 WSGI_APPLICATION = 'core.wsgi.application'
 
 
-DATABASES = {
+# DATABASE_ENGINE is "sqlite" (one file, fine for a single server) or
+# "postgresql" (psycopg, in requirements.txt) for concurrent writers.
+DATABASE_ENGINE = config('DATABASE_ENGINE', default='sqlite')
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DATABASE_NAME', default='anc_tracker'),
+            'USER': config('DATABASE_USER', default='postgres'),
+            'PASSWORD': config('DATABASE_PASSWORD', default=''),
+            'HOST': config('DATABASE_HOST', default='localhost'),
+            'PORT': config('DATABASE_PORT', default='5432'),
+            # keep connections open between requests, checked before reuse
+            'CONN_MAX_AGE': config('DATABASE_CONN_MAX_AGE', default=600, cast=int),
+            'CONN_HEALTH_CHECKS': True,
+            # behind PgBouncer in transaction mode server-side cursors
+            # (QuerySet.iterator()) can't span pooled connections
+            'DISABLE_SERVER_SIDE_CURSORS': config('DATABASE_PGBOUNCER', default=False, cast=bool),
+            'OPTIONS': {
+                'connect_timeout': config('DATABASE_CONNECT_TIMEOUT', default=5, cast=int),
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DATABASE_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+            'OPTIONS': {
+                # seconds a connection waits for the write lock before "database is locked"
+                'timeout': config('SQLITE_TIMEOUT', default=20, cast=int),
+            },
+        }
+    }
+
+# Cache shared by every worker and management command: the version keys that
+# tell processes to rebuild the location tree, access scopes and transfer stats
+# (core.versions) only work if all of them see the same cache. The default is
+# the cache table created by migrations; point CACHE_BACKEND/CACHE_LOCATION at
+# Redis or Memcached to take it off the database.
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': config('CACHE_LOCATION', default='django_cache'),
+    }
+}
+
+# Read replicas, comma separated: hosts of PostgreSQL standbys, or files for
+# SQLite. They become the aliases replica1, replica2... that the dashboards,
+# lists and analytics read from (main.routers). A client that wrote reads from
+# the primary for REPLICA_PIN_SECONDS, longer than the replication lag.
+DATABASE_REPLICAS = config('DATABASE_REPLICAS', default='', cast=Csv())
+for i, location in enumerate(DATABASE_REPLICAS, 1):
+    DATABASES[f'replica{i}'] = {
+        **DATABASES['default'],
+        'HOST' if DATABASE_ENGINE == 'postgresql' else 'NAME': location,
+        'TEST': {'MIRROR': 'default'},
     }
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=10, cast=int)
+DATABASE_ROUTERS = ['main.routers.ReplicaRouter']
+
+# PRAGMAs run on every new SQLite connection (main.signals.tune_sqlite): WAL
+# lets readers and the writer work at the same time, synchronous=NORMAL only
+# syncs at checkpoints in WAL mode, busy_timeout (ms) makes writers wait for
+# the lock and mmap_size (bytes) reads the file through memory mapping.
+SQLITE_PRAGMAS = {
+    'journal_mode': config('SQLITE_JOURNAL_MODE', default='wal'),
+    'synchronous': config('SQLITE_SYNCHRONOUS', default='normal'),
+    'busy_timeout': config('SQLITE_BUSY_TIMEOUT', default=20000, cast=int),
+    'mmap_size': config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int),
+    'temp_store': 'memory',
 }
 
 EMAIL_BACKEND = config('EMAIL_BACKEND')
@@ -70,6 +140,9 @@ DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL')
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 
+# main.send_sms.LocmemBackend keeps messages in main.send_sms.outbox instead of calling Twilio
+SMS_BACKEND = config('SMS_BACKEND', default='main.send_sms.TwilioBackend')
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -107,3 +180,33 @@ MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / "media"
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Count the queries of list views against their query_budget: "warn" logs
+# overruns, "raise" makes them fail (use it in CI), empty disables counting.
+QUERY_BUDGET_CHECK = config('QUERY_BUDGET_CHECK', default='warn' if DEBUG else '')
+
+# Outbox worker (manage.py send_notifications): a failed notification is
+# retried after NOTIFICATION_BACKOFF * 2^(attempt-1) seconds, capped at
+# NOTIFICATION_MAX_BACKOFF, and dead-lettered after NOTIFICATION_MAX_ATTEMPTS.
+NOTIFICATION_MAX_ATTEMPTS = config('NOTIFICATION_MAX_ATTEMPTS', default=6, cast=int)
+NOTIFICATION_BACKOFF = config('NOTIFICATION_BACKOFF', default=30, cast=int)
+NOTIFICATION_MAX_BACKOFF = config('NOTIFICATION_MAX_BACKOFF', default=3600, cast=int)
+# SMS per second and per worker, to stay within the provider's throughput (0 disables it)
+SMS_RATE_LIMIT = config('SMS_RATE_LIMIT', default=1, cast=float)
+
+# seconds a process keeps its location tree before checking the version in the
+# cache again (location.tree): location edits in other processes show up
+# within this delay, and the dropdowns run no query in between
+LOCATION_TREE_CHECK_SECONDS = config('LOCATION_TREE_CHECK_SECONDS', default=5, cast=float)
+
+# manage.py send_reminders reminds patients of appointments in the next REMINDER_WINDOW_HOURS
+REMINDER_WINDOW_HOURS = config('REMINDER_WINDOW_HOURS', default=24, cast=int)
+# manage.py detect_overdue flags transfers without arrival after this many hours
+TRANSFER_OVERDUE_HOURS = config('TRANSFER_OVERDUE_HOURS', default=24, cast=int)
+
+# Patient search index: main.search.SQLiteFTSBackend (FTS5, SQLite only) or
+# main.search.DatabaseBackend (plain prefix queries, any database)
+PATIENT_SEARCH_BACKEND = config(
+    'PATIENT_SEARCH_BACKEND',
+    default='main.search.SQLiteFTSBackend' if DATABASES['default']['ENGINE'].endswith('sqlite3') else 'main.search.DatabaseBackend',
+)
@@ -6,6 +6,7 @@ from django.conf.urls.static import static
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('',include('main.urls')),
+    path('locations/', include('location.urls')),
 ]
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL,
@@ -0,0 +1,28 @@
+"""
+Version keys in the shared cache (settings.CACHES). Data derived from the
+database and kept in a process or in the cache is tagged with the version of
+its key; bumping the key from any process, a management command included,
+makes every worker rebuild that data on its next read.
+"""
+from uuid import uuid4
+
+from django.core.cache import cache
+
+
+def versions(*keys):
+    """Current version of each key, created on first use, in one cache round trip"""
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        for key in missing:
+            cache.add(key, uuid4().hex, None)
+        found.update(cache.get_many(missing))
+    return [found[key] for key in keys]
+
+
+def version(key):
+    return versions(key)[0]
+
+
+def bump(*keys):
+    cache.set_many({key: uuid4().hex for key in keys}, None)
@@ -1,7 +1,13 @@
 from django.contrib import admin
-from .models import District, Sector, Cell, Village
+from .models import District, Sector, Cell, Village, LocationSync
 
 admin.site.register(District)
 admin.site.register(Sector)
 admin.site.register(Cell)
 admin.site.register(Village)
+
+
+@admin.register(LocationSync)
+class LocationSyncAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'source', 'digest')
+    readonly_fields = ('created_at', 'source', 'digest', 'summary')
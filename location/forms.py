@@ -0,0 +1,84 @@
+from django import forms
+from django.core.exceptions import ValidationError
+
+from .tree import LEVELS, get_tree
+
+
+class LocationChoiceField(forms.ChoiceField):
+    """
+    One level of the location tree, validated against the cached tree instead
+    of a query. Pass ``tree`` to share one get_tree() between the fields of a form.
+    """
+
+    def __init__(self, level, parent_id=None, empty_label='---------', tree=None, **kwargs):
+        self.level = level
+        self.empty_label = empty_label
+        self.tree = tree or get_tree()
+        super().__init__(**kwargs)
+        self.set_parent(parent_id)
+
+    def set_parent(self, parent_id):
+        nodes = self.tree.children_of(self.level, parent_id)
+        self.choices = [('', self.empty_label)] + [(node.id, node.name) for node in nodes]
+
+    def prepare_value(self, value):
+        return getattr(value, 'pk', value)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        node = self.tree.get(self.level, value)
+        if node is None:
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value})
+        model, parent_field = LEVELS[self.level]
+        instance = model(id=node.id, name=node.name, **({parent_field: node.parent_id} if parent_field else {}))
+        instance._state.adding = False
+        return instance
+
+    def validate(self, value):
+        # membership was already checked in to_python, the chain in LocationFormMixin.clean
+        forms.Field.validate(self, value)
+
+    def has_changed(self, initial, data):
+        return str(self.prepare_value(initial) or '') != str(data or '')
+
+
+class LocationFormMixin:
+    """
+    Replaces the district/sector/cell/village ModelChoiceFields of a ModelForm
+    with tree-backed fields: choices are filtered by the selected parent and
+    the whole chain is validated without touching the database.
+    """
+    location_fields = ('district', 'sector', 'cell', 'village')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        tree = get_tree()
+        parent_id = None
+        for name in self.location_fields:
+            field = self.fields[name]
+            self.fields[name] = LocationChoiceField(
+                name, parent_id, tree=tree, required=field.required, widget=field.widget, label=field.label,
+                help_text=field.help_text,
+            )
+            if self.is_bound:
+                parent_id = self.data.get(self.add_prefix(name))
+            else:
+                parent_id = self.get_initial_for_field(field, name)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        for parent, child in zip(self.location_fields, self.location_fields[1:]):
+            parent_value, child_value = cleaned_data.get(parent), cleaned_data.get(child)
+            if parent_value and child_value and getattr(child_value, f'{parent}_id') != parent_value.pk:
+                self.add_error(child, ValidationError(
+                    f'Select a {child} that belongs to the selected {parent}.', code='invalid_choice',
+                ))
+        return cleaned_data
+
+    def _get_validation_exclusions(self):
+        # Existence of the location rows was checked against the tree, skip
+        # the per-field lookups done by Model.full_clean.
+        exclude = super()._get_validation_exclusions()
+        exclude.update(self.location_fields)
+        return exclude
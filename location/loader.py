@@ -0,0 +1,290 @@
+import hashlib
+from collections import namedtuple
+
+import openpyxl
+from django.db import transaction
+
+from .models import District, Sector, Cell, Village, LocationSync
+from .tree import invalidate
+
+COLUMNS = ('DISTRICT NAME', 'SECTOR NAME', 'CELL NAME', 'VILLAGE NAME', 'VILLAGE CODE')
+
+LocationRow = namedtuple('LocationRow', ['district', 'sector', 'cell', 'village', 'village_code'])
+
+
+def _clean(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def read_rows(file_path, sheet_name):
+    """Stream the location rows of a sheet without loading the workbook in memory."""
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook[sheet_name].iter_rows(values_only=True)
+        header = [_clean(value) for value in next(rows, ())]
+        missing = [column for column in COLUMNS if column not in header]
+        if missing:
+            raise ValueError(f"Missing columns in sheet {sheet_name}: {', '.join(missing)}")
+        positions = [header.index(column) for column in COLUMNS]
+
+        for values in rows:
+            row = [_clean(values[i]) if i < len(values) else '' for i in positions]
+            # blank lines and partially filled rows can not be placed in the tree
+            if all(row):
+                yield LocationRow(*row)
+    finally:
+        workbook.close()
+
+
+@transaction.atomic
+def bulk_load(rows, batch_size=1000, dry_run=False):
+    """
+    Insert the District -> Sector -> Cell -> Village hierarchy level by level.
+
+    Parents are deduplicated in memory and only the missing ones are created.
+    Villages are upserted on village_code, so loading the same sheet twice
+    only writes what changed. Returns a dict of counters.
+    """
+    stats = dict.fromkeys([
+        'rows', 'districts_created', 'sectors_created', 'cells_created',
+        'villages_created', 'villages_updated', 'villages_unchanged',
+    ], 0)
+
+    district_names, sector_keys, cell_keys, village_rows = {}, {}, {}, {}
+    for row in rows:
+        stats['rows'] += 1
+        district_names[row.district] = None
+        sector_keys[(row.district, row.sector)] = None
+        cell_keys[(row.district, row.sector, row.cell)] = None
+        village_rows[row.village_code] = row
+
+    district_ids = {name: pk for pk, name in District.objects.values_list('id', 'name')}
+    created = District.objects.bulk_create(
+        [District(name=name) for name in district_names if name not in district_ids],
+        batch_size=batch_size,
+    )
+    district_ids.update((district.name, district.pk) for district in created)
+    stats['districts_created'] = len(created)
+
+    sector_ids = {(district_id, name): pk for pk, name, district_id in Sector.objects.values_list('id', 'name', 'district_id')}
+    created = Sector.objects.bulk_create(
+        [
+            Sector(name=sector, district_id=district_ids[district])
+            for district, sector in sector_keys
+            if (district_ids[district], sector) not in sector_ids
+        ],
+        batch_size=batch_size,
+    )
+    sector_ids.update(((sector.district_id, sector.name), sector.pk) for sector in created)
+    stats['sectors_created'] = len(created)
+
+    cell_ids = {(sector_id, name): pk for pk, name, sector_id in Cell.objects.values_list('id', 'name', 'sector_id')}
+    new_cells = []
+    for district, sector, cell in cell_keys:
+        sector_id = sector_ids[(district_ids[district], sector)]
+        if (sector_id, cell) not in cell_ids:
+            new_cells.append(Cell(name=cell, sector_id=sector_id))
+    created = Cell.objects.bulk_create(new_cells, batch_size=batch_size)
+    cell_ids.update(((cell.sector_id, cell.name), cell.pk) for cell in created)
+    stats['cells_created'] = len(created)
+
+    existing = {
+        code: (pk, name, cell_id)
+        for pk, code, name, cell_id in Village.objects.filter(village_code__isnull=False).values_list('id', 'village_code', 'name', 'cell_id')
+    }
+    new_villages, changed_villages = [], []
+    for code, row in village_rows.items():
+        cell_id = cell_ids[(sector_ids[(district_ids[row.district], row.sector)], row.cell)]
+        if code not in existing:
+            new_villages.append(Village(name=row.village, village_code=code, cell_id=cell_id))
+        elif existing[code][1:] != (row.village, cell_id):
+            changed_villages.append(Village(id=existing[code][0], name=row.village, village_code=code, cell_id=cell_id))
+    Village.objects.bulk_create(new_villages, batch_size=batch_size)
+    Village.objects.bulk_update(changed_villages, ['name', 'cell'], batch_size=batch_size)
+    stats['villages_created'] = len(new_villages)
+    stats['villages_updated'] = len(changed_villages)
+    stats['villages_unchanged'] = len(village_rows) - len(new_villages) - len(changed_villages)
+
+    if dry_run:
+        transaction.set_rollback(True)
+    else:
+        transaction.on_commit(invalidate)
+    return stats
+
+
+def _row_hash(*parts):
+    return hashlib.blake2b('\x1f'.join(parts).encode(), digest_size=8).hexdigest()
+
+
+def _resolve(sheet_keys, db_nodes, present, parent_ids, village_owner, stats, level):
+    """
+    Map every sheet key of one level to a database id.
+
+    ``sheet_keys`` maps (parent key..., name) to the village codes below it and
+    ``db_nodes`` maps id -> (name, parent_id). Keys found as-is are reused.
+    A missing key takes over the database node that all of its existing
+    villages currently sit under (a rename and/or re-parenting) as long as
+    that node is not ``present`` in the sheet under its current path;
+    otherwise a new node is queued.
+    Returns (ids, updates, creates) where unresolved keys map to None.
+    """
+    by_key = {(parent_id, name): pk for pk, (name, parent_id) in db_nodes.items()}
+    ids, claimed = {}, set(present)
+    for key in sheet_keys:
+        pk = by_key.get((parent_ids(key), key[-1]))
+        if pk is not None:
+            ids[key] = pk
+            claimed.add(pk)
+
+    updates, creates = {}, []
+    for key, codes in sheet_keys.items():
+        if key in ids:
+            continue
+        parent_id, name = parent_ids(key), key[-1]
+        owners = {village_owner(code) for code in codes} - {None}
+        if len(owners) == 1 and (pk := owners.pop()) not in claimed:
+            old_name, old_parent_id = db_nodes[pk]
+            if old_name != name:
+                stats[f'{level}_renamed'] += 1
+            if old_parent_id != parent_id:
+                stats[f'{level}_reparented'] += 1
+            updates[pk] = (name, parent_id)
+            ids[key] = pk
+            claimed.add(pk)
+        else:
+            creates.append(key)
+            ids[key] = None
+    stats[f'{level}_created'] = len(creates)
+    return ids, updates, creates
+
+
+@transaction.atomic
+def sync(rows, batch_size=1000, dry_run=False, source=''):
+    """
+    Bring the location tables in line with the sheet, writing only what changed.
+
+    Every village row is hashed together with its full District/Sector/Cell
+    path and compared with the same hash computed from the tables, so an
+    unchanged reload issues no writes at all. Parents that disappeared from
+    the sheet while their villages moved under a new name are renamed or
+    re-parented in place, keeping the ids referenced by patients and
+    facilities. Rows missing from the sheet are reported, never deleted.
+    The summary is stored as a LocationSync row unless ``dry_run`` is set.
+    """
+    stats = {'rows': 0}
+    for level in ('districts', 'sectors', 'cells', 'villages'):
+        stats.update({f'{level}_created': 0, f'{level}_renamed': 0, f'{level}_reparented': 0})
+
+    digest = hashlib.blake2b(digest_size=16)
+    village_rows = {}
+    for row in rows:
+        stats['rows'] += 1
+        village_rows[row.village_code] = row
+        digest.update(_row_hash(*row).encode())
+
+    districts = {pk: (name, None) for pk, name in District.objects.values_list('id', 'name')}
+    sectors = {pk: (name, district_id) for pk, name, district_id in Sector.objects.values_list('id', 'name', 'district_id')}
+    cells = {pk: (name, sector_id) for pk, name, sector_id in Cell.objects.values_list('id', 'name', 'sector_id')}
+    villages = {
+        code: (pk, name, cell_id)
+        for pk, code, name, cell_id in Village.objects.filter(village_code__isnull=False).values_list('id', 'village_code', 'name', 'cell_id')
+    }
+
+    def db_path(cell_id):
+        cell_name, sector_id = cells.get(cell_id, ('', None))
+        sector_name, district_id = sectors.get(sector_id, ('', None))
+        return districts.get(district_id, ('', None))[0], sector_name, cell_name
+
+    changed = {
+        code: row for code, row in village_rows.items()
+        if code not in villages or _row_hash(*db_path(villages[code][2]), villages[code][1], code) != _row_hash(*row)
+    }
+    stats['villages_unchanged'] = len(village_rows) - len(changed)
+    stats['villages_missing'] = len(villages.keys() - village_rows.keys())
+
+    # Nodes whose current path is still in the sheet must keep their place.
+    sheet_paths = set()
+    for row in village_rows.values():
+        sheet_paths.update([(row.district,), (row.district, row.sector), (row.district, row.sector, row.cell)])
+    paths = {pk: (name,) for pk, (name, _) in districts.items()}
+    present_districts = {pk for pk, path in paths.items() if path in sheet_paths}
+    paths = {pk: paths.get(parent_id, ('',)) + (name,) for pk, (name, parent_id) in sectors.items()}
+    present_sectors = {pk for pk, path in paths.items() if path in sheet_paths}
+    paths = {pk: paths.get(parent_id, ('', '')) + (name,) for pk, (name, parent_id) in cells.items()}
+    present_cells = {pk for pk, path in paths.items() if path in sheet_paths}
+
+    # Only the branches holding a changed village need to be resolved.
+    district_keys, sector_keys, cell_keys = {}, {}, {}
+    for code, row in changed.items():
+        district_keys.setdefault((row.district,), []).append(code)
+        sector_keys.setdefault((row.district, row.sector), []).append(code)
+        cell_keys.setdefault((row.district, row.sector, row.cell), []).append(code)
+
+    def owner(code, depth):
+        if code not in villages:
+            return None
+        pk = villages[code][2]
+        for nodes in (cells, sectors)[:depth]:
+            pk = nodes.get(pk, (None, None))[1]
+        return pk
+
+    district_ids, updates, creates = _resolve(
+        district_keys, districts, present_districts, lambda key: None, lambda code: owner(code, 2), stats, 'districts',
+    )
+    District.objects.bulk_update(
+        [District(id=pk, name=name) for pk, (name, _) in updates.items()], ['name'], batch_size=batch_size,
+    )
+    for district in District.objects.bulk_create([District(name=key[-1]) for key in creates], batch_size=batch_size):
+        district_ids[(district.name,)] = district.pk
+
+    sector_ids, updates, creates = _resolve(
+        sector_keys, sectors, present_sectors, lambda key: district_ids[key[:1]], lambda code: owner(code, 1), stats, 'sectors',
+    )
+    Sector.objects.bulk_update(
+        [Sector(id=pk, name=name, district_id=parent_id) for pk, (name, parent_id) in updates.items()],
+        ['name', 'district'], batch_size=batch_size,
+    )
+    created = Sector.objects.bulk_create(
+        [Sector(name=key[-1], district_id=district_ids[key[:1]]) for key in creates], batch_size=batch_size,
+    )
+    sector_ids.update(zip(creates, (sector.pk for sector in created)))
+
+    cell_ids, updates, creates = _resolve(
+        cell_keys, cells, present_cells, lambda key: sector_ids[key[:2]], lambda code: owner(code, 0), stats, 'cells',
+    )
+    Cell.objects.bulk_update(
+        [Cell(id=pk, name=name, sector_id=parent_id) for pk, (name, parent_id) in updates.items()],
+        ['name', 'sector'], batch_size=batch_size,
+    )
+    created = Cell.objects.bulk_create(
+        [Cell(name=key[-1], sector_id=sector_ids[key[:2]]) for key in creates], batch_size=batch_size,
+    )
+    cell_ids.update(zip(creates, (cell.pk for cell in created)))
+
+    new_villages, changed_villages = [], []
+    for code, row in changed.items():
+        cell_id = cell_ids[(row.district, row.sector, row.cell)]
+        if code not in villages:
+            new_villages.append(Village(name=row.village, village_code=code, cell_id=cell_id))
+            continue
+        pk, name, old_cell_id = villages[code]
+        if name != row.village:
+            stats['villages_renamed'] += 1
+        if old_cell_id != cell_id:
+            stats['villages_reparented'] += 1
+        if (name, old_cell_id) != (row.village, cell_id):
+            changed_villages.append(Village(id=pk, name=row.village, village_code=code, cell_id=cell_id))
+    Village.objects.bulk_create(new_villages, batch_size=batch_size)
+    Village.objects.bulk_update(changed_villages, ['name', 'cell'], batch_size=batch_size)
+    stats['villages_created'] = len(new_villages)
+
+    if dry_run:
+        transaction.set_rollback(True)
+    else:
+        LocationSync.objects.create(source=source, digest=digest.hexdigest(), summary=stats)
+        transaction.on_commit(invalidate)
+    return stats
@@ -1,34 +1,38 @@
-import pandas as pd
-from django.core.management.base import BaseCommand
-from location.models import District, Sector, Cell, Village
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from location.loader import read_rows, bulk_load, sync
 from core.settings import BASE_DIR
 
 class Command(BaseCommand):
     help = 'Load data from Excel file into the database'
 
-    def handle(self, *args, **kwargs):
-        file_path = BASE_DIR / 'merged_output.xlsx'
-        # file_path = r'C:\Users\PC\Desktop\jackproject\merged_output.xlsx'
-        df = pd.read_excel(file_path, sheet_name='removedblanks')
-
-        for index, row in df.iterrows():
-            district_name = row['DISTRICT NAME']
-            sector_name = row['SECTOR NAME']
-            cell_name = row['CELL NAME']
-            village_name = row['VILLAGE NAME']
-            village_code = row['VILLAGE CODE']
-
-            # Get or create district
-            district, _ = District.objects.get_or_create(name=district_name)
-            
-            # Get or create sector
-            sector, _ = Sector.objects.get_or_create(name=sector_name, district=district)
-            
-            # Get or create cell
-            cell, _ = Cell.objects.get_or_create(name=cell_name, sector=sector)
-            
-            # Get or create village
-            village, _ = Village.objects.get_or_create(name=village_name, village_code=village_code, cell=cell)
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=str(BASE_DIR / 'merged_output.xlsx'), help='Path of the Excel workbook')
+        parser.add_argument('--sheet', default='removedblanks', help='Sheet holding the location rows')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT/UPDATE statement')
+        parser.add_argument('--dry-run', action='store_true', help='Compute the changes and roll them back')
+        parser.add_argument(
+            '--sync', action='store_true',
+            help='Only apply the inserts, renames and re-parentings that differ from the database and record a summary',
+        )
 
-            self.stdout.write(self.style.SUCCESS(f'Successfully loaded {village_name}'))
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        rows = read_rows(options['file'], options['sheet'])
+        try:
+            if options['sync']:
+                stats = sync(rows, batch_size=options['batch_size'], dry_run=options['dry_run'], source=options['file'])
+            else:
+                stats = bulk_load(rows, batch_size=options['batch_size'], dry_run=options['dry_run'])
+        except (FileNotFoundError, KeyError, ValueError) as e:
+            raise CommandError(e)
+        elapsed = time.monotonic() - started
 
+        for key, value in stats.items():
+            self.stdout.write(f'{key.replace("_", " ")}: {value}')
+        rate = stats['rows'] / elapsed if elapsed else stats['rows']
+        prefix = '[dry run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}Loaded {stats['rows']} rows in {elapsed:.2f}s ({rate:.0f} rows/s)"
+        ))
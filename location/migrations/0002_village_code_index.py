@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-18 11:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='village',
+            name='village_code',
+            field=models.CharField(blank=True, db_index=True, max_length=150, null=True),
+        ),
+    ]
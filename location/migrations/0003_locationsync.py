@@ -0,0 +1,26 @@
+# Generated by Django 5.0.7 on 2026-10-18 11:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0002_village_code_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationSync',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('source', models.CharField(blank=True, max_length=255)),
+                ('digest', models.CharField(max_length=32)),
+                ('summary', models.JSONField(default=dict)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
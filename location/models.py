@@ -22,8 +22,62 @@ class Cell(models.Model):
 
 class Village(models.Model):
     name = models.CharField(max_length=100, null=False, blank=False)
-    village_code = models.CharField(max_length=150, null=True, blank=True)
+    village_code = models.CharField(max_length=150, null=True, blank=True, db_index=True)
     cell = models.ForeignKey(Cell, on_delete=models.SET_NULL, null=True)
 
     def __str__(self):
         return self.name
+
+
+class LocationSync(models.Model):
+    """Summary of one incremental sync of the location hierarchy"""
+    created_at = models.DateTimeField(auto_now_add=True)
+    source = models.CharField(max_length=255, blank=True)
+    digest = models.CharField(max_length=32)
+    summary = models.JSONField(default=dict)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'Sync of {self.source} on {self.created_at:%Y-%m-%d %H:%M}'
+
+
+def location_path(district_id=None, sector_id=None, cell_id=None, village_id=None):
+    """Materialized '/district/sector/cell/village/' path, cut at the first missing level"""
+    path = '/'
+    for pk in (district_id, sector_id, cell_id, village_id):
+        if pk is None:
+            break
+        path += f'{pk}/'
+    return path if path != '/' else ''
+
+
+class LocatedQuerySet(models.QuerySet):
+
+    def in_location(self, district_id, sector_id=None, cell_id=None, field='location_path'):
+        """
+        Rows under a district, sector or cell as one range scan on the path index:
+        every path starting with '/3/17/' sorts between '/3/17/' and '/3/170'.
+        """
+        prefix = location_path(district_id, sector_id, cell_id)
+        return self.filter(**{f'{field}__gte': prefix, f'{field}__lt': prefix[:-1] + '0'})
+
+
+class LocationPathMixin(models.Model):
+    """Keeps ``location_path`` in sync with the district/sector/cell/village foreign keys"""
+    location_path = models.CharField(max_length=100, blank=True, default='', editable=False, db_index=True)
+
+    objects = LocatedQuerySet.as_manager()
+
+    LOCATION_FIELDS = {'district', 'district_id', 'sector', 'sector_id', 'cell', 'cell_id', 'village', 'village_id'}
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        self.location_path = location_path(self.district_id, self.sector_id, self.cell_id, self.village_id)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and self.LOCATION_FIELDS.intersection(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'location_path'}
+        super().save(*args, **kwargs)
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import District, Sector, Cell, Village
+from .tree import invalidate
+
+
+@receiver([post_save, post_delete], sender=District)
+@receiver([post_save, post_delete], sender=Sector)
+@receiver([post_save, post_delete], sender=Cell)
+@receiver([post_save, post_delete], sender=Village)
+def invalidate_location_tree(sender, **kwargs):
+    invalidate()
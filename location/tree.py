@@ -0,0 +1,125 @@
+import gzip
+import json
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.template.loader import render_to_string
+
+from core.versions import bump, version
+from .models import District, Sector, Cell, Village
+
+VERSION_KEY = 'location-tree-version'
+
+Node = namedtuple('Node', ['id', 'name', 'parent_id'])
+
+LEVELS = {
+    'district': (District, None),
+    'sector': (Sector, 'district_id'),
+    'cell': (Cell, 'sector_id'),
+    'village': (Village, 'cell_id'),
+}
+
+
+class LocationTree:
+    """Read-only adjacency index of the District -> Sector -> Cell -> Village tree"""
+
+    def __init__(self, version):
+        self.version = version
+        self.nodes = {}
+        self.children = {}
+        for level, (model, parent_field) in LEVELS.items():
+            fields = ['id', 'name', parent_field] if parent_field else ['id', 'name']
+            nodes, children = {}, {}
+            for values in model.objects.order_by('id').values_list(*fields):
+                node = Node(*values) if parent_field else Node(*values, None)
+                nodes[node.id] = node
+                children.setdefault(node.parent_id, []).append(node)
+            self.nodes[level] = nodes
+            self.children[level] = children
+        self._fragments = {}
+
+    def get(self, level, pk):
+        try:
+            return self.nodes[level].get(int(pk))
+        except (TypeError, ValueError):
+            return None
+
+    def children_of(self, level, parent_id):
+        """Nodes of ``level`` below ``parent_id`` (all districts when level is district)"""
+        if level == 'district':
+            return self.children[level].get(None, [])
+        try:
+            return self.children[level].get(int(parent_id), [])
+        except (TypeError, ValueError):
+            return []
+
+    def options(self, level, parent_id):
+        """Rendered ``<option>`` list for a dropdown and its ETag"""
+        nodes = self.children_of(level, parent_id)
+        key = (level, nodes[0].parent_id if nodes else None)
+        if key not in self._fragments:
+            html = render_to_string('htmx/location_dropdown.html', {'items': nodes})
+            self._fragments[key] = (html, f'"{self.version}-{level}-{key[1] or 0}"')
+        return self._fragments[key]
+
+    def bundle(self, district_id=None):
+        """
+        Compact JSON of the whole tree, or of one district's subtree, as
+        (raw bytes, gzipped bytes, ETag). Rows are ``[id, name, parent_id]``.
+        """
+        key = ('bundle', district_id)
+        if key not in self._fragments:
+            if district_id is None:
+                districts = self.children_of('district', None)
+            else:
+                districts = [self.nodes['district'][district_id]]
+            sectors = [node for parent in districts for node in self.children['sector'].get(parent.id, [])]
+            cells = [node for parent in sectors for node in self.children['cell'].get(parent.id, [])]
+            villages = [node for parent in cells for node in self.children['village'].get(parent.id, [])]
+            payload = {
+                'version': self.version,
+                'districts': [[node.id, node.name] for node in districts],
+                'sectors': [list(node) for node in sectors],
+                'cells': [list(node) for node in cells],
+                'villages': [list(node) for node in villages],
+            }
+            raw = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode()
+            self._fragments[key] = (raw, gzip.compress(raw), f'"{self.version}-bundle-{district_id or 0}"')
+        return self._fragments[key]
+
+
+_tree = None
+_checked_at = None
+_lock = threading.Lock()
+
+
+def current_version():
+    return version(VERSION_KEY)
+
+
+def get_tree():
+    """
+    Return the process-wide tree, rebuilding it when another process or a
+    location write bumped the version stored in the cache. The version is
+    read at most every LOCATION_TREE_CHECK_SECONDS, so the dropdowns and
+    forms run no query in between: writes of this process show at once,
+    those of other processes within that delay.
+    """
+    global _tree, _checked_at
+    now = time.monotonic()
+    if _tree is not None and _checked_at is not None and now - _checked_at < settings.LOCATION_TREE_CHECK_SECONDS:
+        return _tree
+    current = current_version()
+    with _lock:
+        if _tree is None or _tree.version != current:
+            _tree = LocationTree(current)
+        _checked_at = now
+    return _tree
+
+
+def invalidate(*args, **kwargs):
+    global _checked_at
+    bump(VERSION_KEY)
+    _checked_at = None
@@ -0,0 +1,7 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('bundle/', views.location_bundle, name='location-bundle'),
+    path('bundle/<int:district_id>/', views.location_bundle, name='location-bundle-district'),
+]
@@ -1,3 +1,39 @@
-from django.shortcuts import render
+from django.http import Http404, HttpResponse
+from django.shortcuts import redirect
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
 
-# Create your views here.
+from .tree import get_tree
+
+BUNDLE_MAX_AGE = 60 * 60 * 24 * 365
+
+
+def location_bundle(request, district_id=None):
+    """
+    Whole location hierarchy (or one district's subtree) as a single JSON
+    document so forms can fill their dropdowns without a request per change.
+
+    ``?v=<version>`` URLs never change and are cached for a year; the plain
+    URL is revalidated with its ETag.
+    """
+    tree = get_tree()
+    if district_id is not None and tree.get('district', district_id) is None:
+        raise Http404("Unknown district")
+
+    version = request.GET.get('v')
+    if version and version != tree.version:
+        return redirect(f'{request.path}?v={tree.version}')
+
+    raw, compressed, etag = tree.bundle(district_id)
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = HttpResponse(compressed, content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+        etag = etag[:-1] + '-gz"'
+    else:
+        response = HttpResponse(raw, content_type='application/json')
+    response['ETag'] = etag
+    patch_vary_headers(response, ['Accept-Encoding'])
+    if version:
+        patch_cache_control(response, public=True, max_age=BUNDLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return get_conditional_response(request, etag=etag, response=response)
@@ -0,0 +1,144 @@
+"""
+The access scope of a request: the user's role and the CHW or facility their
+lists are limited to. AccessScopeMiddleware puts it on ``request.scope``; it is
+built with one query and kept in the session, so views never load the user's
+assignments again.
+
+A session rebuilds its scope when the user's own row no longer matches it
+(role or assignment changed), or when the CHW or facility it names was saved:
+each of them has a version in the shared cache (core.versions), bumped only
+for the users assigned to it.
+"""
+from collections import namedtuple
+
+from django.db import DEFAULT_DB_ALIAS
+from django.http import Http404
+from django.utils.functional import SimpleLazyObject
+
+from core.versions import bump, version
+from .models import PatientAccess, Role, User
+
+VERSION_KEY = 'access-scope'
+SESSION_KEY = '_access_scope'
+
+
+class AccessScope(namedtuple('AccessScope', [
+    'user_id', 'role', 'is_superuser',
+    'community_work_id', 'community_work_name', 'health_facility_id', 'health_facility_name',
+])):
+    __slots__ = ()
+
+    @property
+    def is_admin(self):
+        return self.is_superuser or self.role == Role.ADMIN
+
+    @property
+    def is_facility(self):
+        return self.role in (Role.HEALTH_FACILITY, Role.HOSPITAL)
+
+    @property
+    def facility_id(self):
+        """The facility HF and hospital users are limited to, None for everyone else"""
+        return (self.health_facility_id or 0) if self.is_facility else None
+
+    @property
+    def assignment(self):
+        """Name of the CHW or facility shown under the username"""
+        if self.role == Role.CHW:
+            return self.community_work_name
+        if self.is_facility:
+            return self.health_facility_name
+        return 'Admin'
+
+    @property
+    def membership(self):
+        """The PatientAccess (scope, scope_id) of the user's patients, None for admins"""
+        if self.role == Role.CHW:
+            return PatientAccess.CHW, self.community_work_id or 0
+        if self.is_facility:
+            return PatientAccess.FACILITY, self.health_facility_id or 0
+        return None
+
+    def _assigned(self):
+        if self.role == Role.CHW and not self.community_work_id:
+            raise Http404("No CommunityWork assigned to this user.")
+        if self.is_facility and not self.health_facility_id:
+            raise Http404("No HealthFacility assigned to this user.")
+        if self.membership is None and not self.is_admin:
+            raise Http404("Unauthorized role.")
+        return self.membership
+
+    def filter(self, queryset, community_work='community_work', health_facility='health_facility'):
+        """``queryset`` limited to the rows of the user's CHW or facility, found through the given fields"""
+        membership = self._assigned()
+        if membership is None:
+            return queryset
+        scope, scope_id = membership
+        return queryset.filter(**{community_work if scope == PatientAccess.CHW else health_facility: scope_id})
+
+    def filter_patients(self, queryset, patient='pk'):
+        """``queryset`` limited to the patients the user's CHW or facility may see, with a semi-join on PatientAccess"""
+        membership = self._assigned()
+        if membership is None:
+            return queryset
+        scope, scope_id = membership
+        members = PatientAccess.objects.filter(scope=scope, scope_id=scope_id).values('patient')
+        return queryset.filter(**{f'{patient}__in': members})
+
+
+ANONYMOUS = AccessScope(None, None, False, None, '', None, '')
+
+
+def version_key(role, community_work_id, health_facility_id):
+    """Cache key of the version of the CHW or facility a scope names, None for admins"""
+    if role == Role.CHW:
+        return f'{VERSION_KEY}:{PatientAccess.CHW}:{community_work_id}'
+    if role in (Role.HEALTH_FACILITY, Role.HOSPITAL):
+        return f'{VERSION_KEY}:{PatientAccess.FACILITY}:{health_facility_id}'
+    return None
+
+
+def invalidate(scope, scope_id):
+    """Rebuild the scopes of the users assigned to one CHW or facility (a PatientAccess scope)"""
+    bump(f'{VERSION_KEY}:{scope}:{scope_id}')
+
+
+def build(user_id):
+    # from the primary: a replica may not have the change that invalidated the scope yet
+    user = User.objects.using(DEFAULT_DB_ALIAS).select_related('chw_assigned', 'health_facility_assigned').get(pk=user_id)
+    chw, facility = user.chw_assigned, user.health_facility_assigned
+    return AccessScope(
+        user.pk, user.role, user.is_superuser,
+        user.chw_assigned_id, chw and f'{chw.first_name} {chw.last_name}',
+        user.health_facility_assigned_id, facility and facility.name,
+    )
+
+
+def get_scope(request):
+    user = request.user
+    if not user.is_authenticated:
+        return ANONYMOUS
+    key = version_key(user.role, user.chw_assigned_id, user.health_facility_assigned_id)
+    current = version(key) if key else None
+    cached = request.session.get(SESSION_KEY)
+    if cached and cached[0] == current:
+        scope = AccessScope(*cached[1])
+        # the user row is loaded on every request anyway: a change to it shows at once
+        if (scope.user_id, scope.role, scope.is_superuser, scope.community_work_id, scope.health_facility_id) == (
+            user.pk, user.role, user.is_superuser, user.chw_assigned_id, user.health_facility_assigned_id,
+        ):
+            return scope
+    scope = build(user.pk)
+    request.session[SESSION_KEY] = [current, list(scope)]
+    return scope
+
+
+class AccessScopeMiddleware:
+    """Sets ``request.scope``, resolved on first use; goes after AuthenticationMiddleware"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.scope = SimpleLazyObject(lambda: get_scope(request))
+        return self.get_response(request)
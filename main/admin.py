@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Patient, Appointment, HealthFacility, Doctor, CommunityWork, Visit, Transfer
+from django.utils import timezone
+from .models import Patient, Appointment, HealthFacility, Doctor, CommunityWork, Visit, Transfer, Notification
 
 class AppointmentInline(admin.TabularInline):
     model = Appointment
@@ -8,6 +9,15 @@ class AppointmentInline(admin.TabularInline):
 class VisitAdmin(admin.ModelAdmin):
     inlines = [AppointmentInline]
 
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ['channel', 'recipient', 'status', 'attempts', 'next_attempt_at', 'created_at']
+    list_filter = ['status', 'channel']
+    actions = ['retry']
+
+    @admin.action(description="Retry selected notifications")
+    def retry(self, request, queryset):
+        queryset.exclude(status=Notification.SENT).update(status=Notification.PENDING, attempts=0, next_attempt_at=timezone.now())
+
 admin.site.register(Patient)
 admin.site.register(Visit, VisitAdmin)
 admin.site.register(Appointment)
@@ -15,3 +25,4 @@ admin.site.register(HealthFacility)
 admin.site.register(Doctor)
 admin.site.register(CommunityWork)
 admin.site.register(Transfer)
+admin.site.register(Notification, NotificationAdmin)
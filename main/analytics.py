@@ -0,0 +1,235 @@
+from collections import Counter
+from hashlib import md5
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.versions import bump, version
+from .models import HealthFacility, Patient, Transfer, Visit, VisitRollup
+
+# public dimension name -> VisitRollup column
+DIMENSIONS = {
+    'facility': 'health_facility_id',
+    'chw': 'community_work_id',
+    'district': 'district_id',
+    'classification': 'diagnize_classification',
+    'status': 'status',
+}
+FREQUENCIES = {'D': 'D', 'W': 'W-SUN', 'M': 'M'}
+TRANSFER_STATS_VERSION_KEY = 'transfer-stats-version'
+TRANSFER_STATS_TIMEOUT = 60 * 60
+KEY_FIELDS = ['day', 'health_facility_id', 'community_work_id', 'district_id', 'diagnize_classification', 'status']
+
+
+def rollup_key(visit, district_id):
+    day = timezone.localdate(visit.date) if visit.date else timezone.localdate()
+    return (
+        day, visit.health_facility_id or 0, visit.community_work_id or 0, district_id or 0,
+        visit.diagnize_classification, visit.status,
+    )
+
+
+def visit_district(visit):
+    if Visit.patient.is_cached(visit):
+        return visit.patient.district_id if visit.patient else None
+    return Patient.objects.filter(pk=visit.patient_id).values_list('district_id', flat=True).first()
+
+
+def apply(deltas):
+    """Add ``deltas`` ({rollup key: n}) to the rollup rows, creating missing ones"""
+    deltas = {key: n for key, n in deltas.items() if n}
+    if not deltas:
+        return
+    VisitRollup.objects.bulk_create(
+        [VisitRollup(**dict(zip(KEY_FIELDS, key))) for key in deltas], ignore_conflicts=True,
+    )
+    by_amount = {}
+    for key, n in deltas.items():
+        by_amount.setdefault(n, Q())
+        by_amount[n] |= Q(**dict(zip(KEY_FIELDS, key)))
+    for n, condition in by_amount.items():
+        VisitRollup.objects.filter(condition).update(count=F('count') + n)
+
+
+def record_visits(visits):
+    """Roll up freshly created visits, e.g. after a bulk_create which sends no signals"""
+    apply(Counter(rollup_key(visit, visit_district(visit)) for visit in visits))
+
+
+def visit_frame(start=None, end=None, **filters):
+    """
+    Rollup rows between two dates (inclusive) as a DataFrame. ``filters``
+    use the public dimension names, e.g. facility=3 or status='active'.
+    """
+    queryset = VisitRollup.objects.all()
+    if start:
+        queryset = queryset.filter(day__gte=start)
+    if end:
+        queryset = queryset.filter(day__lte=end)
+    for name, value in filters.items():
+        queryset = queryset.filter(**{DIMENSIONS[name]: value})
+    frame = pd.DataFrame.from_records(
+        queryset.values_list(*KEY_FIELDS, 'count'), columns=[*KEY_FIELDS, 'count'],
+    )
+    frame['day'] = pd.to_datetime(frame['day'])
+    return frame.rename(columns={column: name for name, column in DIMENSIONS.items()})
+
+
+def visit_trends(start=None, end=None, freq='D', group_by=(), **filters):
+    """
+    Visit counts per period ('D', 'W' or 'M') and per ``group_by`` dimensions,
+    as a DataFrame with a ``period`` column, one column per dimension and
+    ``count``. Only rollup rows are read, never the visits themselves.
+    """
+    group_by = list(group_by)
+    unknown = [name for name in group_by if name not in DIMENSIONS]
+    if unknown or freq not in FREQUENCIES:
+        raise ValueError(f"Unknown dimension or frequency: {', '.join(unknown) or freq}")
+    frame = visit_frame(start, end, **filters)
+    if frame.empty:
+        return pd.DataFrame(columns=['period', *group_by, 'count'])
+    frame['period'] = frame['day'].dt.to_period(FREQUENCIES[freq]).dt.start_time
+    return frame.groupby(['period', *group_by], sort=True)['count'].sum().reset_index()
+
+
+def visit_totals(dimension, start=None, end=None, **filters):
+    """Visit count per value of one dimension, largest first"""
+    frame = visit_frame(start, end, **filters)
+    return frame.groupby(dimension)['count'].sum().sort_values(ascending=False)
+
+
+@transaction.atomic
+def rebuild():
+    """Recompute the rollup table from the visits"""
+    rows = (
+        Visit.objects
+        .annotate(day=TruncDate('date'))
+        .values('day', 'health_facility_id', 'community_work_id', 'patient__district_id', 'diagnize_classification', 'status')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    rollups = Counter()
+    for row in rows:
+        key = (
+            row['day'], row['health_facility_id'] or 0, row['community_work_id'] or 0, row['patient__district_id'] or 0,
+            row['diagnize_classification'], row['status'],
+        )
+        rollups[key] += row['n']
+    VisitRollup.objects.all().delete()
+    VisitRollup.objects.bulk_create(
+        [VisitRollup(**dict(zip(KEY_FIELDS, key)), count=n) for key, n in rollups.items()], batch_size=1000,
+    )
+    return len(rollups)
+
+
+def transfer_stats_version():
+    return version(TRANSFER_STATS_VERSION_KEY)
+
+
+def invalidate_transfer_stats(*args, **kwargs):
+    bump(TRANSFER_STATS_VERSION_KEY)
+
+
+def transfer_intervals(start=None, end=None, **filters):
+    """
+    Transfers as NumPy arrays: from and to facility ids, the transfer time
+    (datetime64, local time) and the delay in hours (NaN while not arrived).
+    ``filters`` are passed to Transfer.objects.filter().
+    """
+    queryset = Transfer.objects.filter(**filters)
+    if start:
+        queryset = queryset.filter(transfer_date__date__gte=start)
+    if end:
+        queryset = queryset.filter(transfer_date__date__lte=end)
+    frame = pd.DataFrame.from_records(
+        queryset.values_list('from_health_facility_id', 'to_hospital_id', 'transfer_date', 'patient_arrived_at').order_by(),
+        columns=['source', 'target', 'transferred', 'arrived'],
+    )
+    transferred = pd.to_datetime(frame['transferred'], utc=True)
+    arrived = pd.to_datetime(frame['arrived'], utc=True)
+    delays = (arrived - transferred).dt.total_seconds().to_numpy(dtype=float) / 3600
+    local = transferred.dt.tz_convert(settings.TIME_ZONE).dt.tz_localize(None).to_numpy()
+    return frame['source'].to_numpy(dtype=np.int64), frame['target'].to_numpy(dtype=np.int64), local, delays
+
+
+def _percentiles(values, lo, counts, q):
+    """
+    The q-th percentile (linear interpolation, like np.percentile) of every
+    group of the sorted ``values``, where group i is values[lo[i]:lo[i] + counts[i]]
+    """
+    position = (counts - 1).clip(0) * q / 100
+    below = np.floor(position).astype(np.int64)
+    above = np.minimum(below + 1, (counts - 1).clip(0))
+    fraction = position - below
+    result = values[lo + below] * (1 - fraction) + values[lo + above] * fraction
+    return np.where(counts > 0, result.round(2), np.nan)
+
+
+def _group_stats(keys, delays):
+    """count, arrived, median, p90 and p99 of ``delays`` per row of ``keys``"""
+    if not len(delays):
+        return []
+    # one integer per key row is much faster to sort than np.unique(axis=0)
+    codes = [np.unique(column, return_inverse=True) for column in keys.T]
+    combined = np.ravel_multi_index([inverse.reshape(-1) for _, inverse in codes], [len(unique) for unique, _ in codes])
+    unique, inverse = np.unique(combined, return_inverse=True)
+    groups = np.column_stack([values[index] for (values, _), index in zip(codes, np.unravel_index(unique, [len(u) for u, _ in codes]))])
+    order = np.lexsort((delays, inverse))  # by group, then delay, NaN last
+    values = np.nan_to_num(delays[order], nan=0)
+    lo = np.searchsorted(inverse[order], np.arange(len(groups)))
+    counts = np.bincount(inverse, minlength=len(groups))
+    arrived = np.bincount(inverse, weights=~np.isnan(delays), minlength=len(groups)).astype(np.int64)
+    columns = {
+        'count': counts.tolist(),
+        'arrived': arrived.tolist(),
+        **{name: _percentiles(values, lo, arrived, q).tolist() for name, q in (('median', 50), ('p90', 90), ('p99', 99))},
+    }
+    return [
+        (group, {name: None if value != value else value for name, value in zip(columns, row)})
+        for group, row in zip(groups, zip(*columns.values()))
+    ]
+
+
+def transfer_delay_stats(by='route', start=None, end=None, **filters):
+    """
+    Transfer delay statistics in hours per (from facility, to hospital) route
+    or per week, slowest median first for routes. Cached until a transfer
+    is created or an arrival confirmed.
+    """
+    if by not in ('route', 'week'):
+        raise ValueError(f"Unknown grouping: {by}")
+    arguments = md5(repr((by, start, end, sorted(filters.items()))).encode()).hexdigest()
+    key = f'transfer-stats:{transfer_stats_version()}:{arguments}'
+    stats = cache.get(key)
+    if stats is None:
+        stats = _transfer_delay_stats(by, start, end, filters)
+        cache.set(key, stats, TRANSFER_STATS_TIMEOUT)
+    return stats
+
+
+def _transfer_delay_stats(by, start, end, filters):
+    sources, targets, transferred, delays = transfer_intervals(start, end, **filters)
+    if by == 'week':
+        weeks = transferred.astype('datetime64[D]')
+        # numpy weeks start on Thursday (1970-01-01); shift to Mondays
+        weeks = (weeks - ((weeks.astype(np.int64) + 3) % 7)).astype(np.int64)
+        return [
+            {'week': str(np.datetime64(int(week[0]), 'D')), **values}
+            for week, values in _group_stats(weeks.reshape(-1, 1), delays)
+        ]
+    names = dict(HealthFacility.objects.filter(pk__in={*sources.tolist(), *targets.tolist()}).values_list('id', 'name'))
+    stats = [
+        {
+            'from_health_facility': names.get(int(source)), 'from_health_facility_id': int(source),
+            'to_hospital': names.get(int(target)), 'to_hospital_id': int(target),
+            **values,
+        }
+        for (source, target), values in _group_stats(np.column_stack((sources, targets)), delays)
+    ]
+    return sorted(stats, key=lambda route: (route['median'] is None, -(route['median'] or 0)))
@@ -0,0 +1,65 @@
+from django.db.models import Q
+
+from .models import CommunityWork, HealthFacility, Patient, Role
+from .normalize import prefix_range, search_key
+from .search import get_backend as search_backend
+
+# Sources of the /autocomplete/<source>/ endpoint: each returns up to ``limit``
+# objects from ``offset`` that the request's access ``scope`` may pick,
+# matching the typed ``term``.
+
+
+def patient_label(patient):
+    return ' '.join(filter(None, (patient.first_name, patient.last_name, patient.identity and f'({patient.identity})')))
+
+
+def community_work_label(community_work):
+    return f'{community_work.first_name} {community_work.last_name}'
+
+
+def health_facility_label(health_facility):
+    return health_facility.name
+
+
+def patients(scope, term, offset, limit, **params):
+    # CHWs record the first visit of a patient, so they may pick any of them
+    membership = scope.membership if scope.is_facility else None
+    if term:
+        ids = search_backend().search(term, membership=membership, limit=offset + limit)[offset:]
+        found = Patient.objects.in_bulk(ids)
+        return [found[pk] for pk in ids if pk in found]
+    queryset = Patient.objects.all()
+    if membership is not None:
+        queryset = scope.filter_patients(queryset)
+    return list(queryset.order_by('-id')[offset:offset + limit])
+
+
+def community_workers(scope, term, offset, limit, **params):
+    queryset = CommunityWork.objects.all()
+    if scope.role == Role.CHW:
+        queryset = queryset.filter(pk=scope.community_work_id or 0)
+    elif scope.facility_id is not None:
+        queryset = queryset.filter(health_facility=scope.facility_id)
+    key = search_key(term)
+    if key:
+        queryset = queryset.filter(Q(**prefix_range('name_key', key)) | Q(**prefix_range('surname_key', key)))
+    return list(queryset.order_by('name_key', 'id')[offset:offset + limit])
+
+
+def health_facilities(scope, term, offset, limit, status=None, **params):
+    queryset = HealthFacility.objects.all()
+    if not scope.is_admin:
+        queryset = queryset.filter(pk=scope.health_facility_id or 0)
+    if status:
+        queryset = queryset.filter(status=status)
+    key = search_key(term)
+    if key:
+        queryset = queryset.filter(**prefix_range('name_key', key))
+    return list(queryset.order_by('name_key', 'id')[offset:offset + limit])
+
+
+SOURCES = {
+    'patients': (patients, patient_label),
+    'community-workers': (community_workers, community_work_label),
+    'health-facilities': (health_facilities, health_facility_label),
+}
@@ -0,0 +1,119 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DashboardCounter, Visit, Transfer
+
+NATIONAL, CHW, FACILITY = DashboardCounter.NATIONAL, DashboardCounter.CHW, DashboardCounter.FACILITY
+
+
+def _scopes(community_work_id, health_facility_id):
+    scopes = [(NATIONAL, 0)]
+    if community_work_id:
+        scopes.append((CHW, community_work_id))
+    if health_facility_id:
+        scopes.append((FACILITY, health_facility_id))
+    return scopes
+
+
+def _visit_keys(day, classification, status):
+    return ['visits', f'visits:{day}', f'classification:{classification}', f'status:{status}']
+
+
+def visit_counters(visit):
+    """Counter keys a visit contributes to"""
+    day = timezone.localdate(visit.date) if visit.date else timezone.localdate()
+    return Counter(
+        (scope, scope_id, key)
+        for scope, scope_id in _scopes(visit.community_work_id, visit.health_facility_id)
+        for key in _visit_keys(day, visit.diagnize_classification, visit.status)
+    )
+
+
+def transfer_counters(transfer, community_work_id):
+    return Counter(
+        (scope, scope_id, 'transfers')
+        for scope, scope_id in _scopes(community_work_id, transfer.from_health_facility_id)
+    )
+
+
+def apply(deltas):
+    """Add ``deltas`` ({(scope, scope_id, key): n}) to the counters, creating missing ones"""
+    deltas = {counter: n for counter, n in deltas.items() if n}
+    if not deltas:
+        return
+    DashboardCounter.objects.bulk_create(
+        [DashboardCounter(scope=scope, scope_id=scope_id, key=key) for scope, scope_id, key in deltas],
+        ignore_conflicts=True,
+    )
+    by_amount = {}
+    for (scope, scope_id, key), n in deltas.items():
+        by_amount.setdefault(n, Q())
+        by_amount[n] |= Q(scope=scope, scope_id=scope_id, key=key)
+    for n, condition in by_amount.items():
+        DashboardCounter.objects.filter(condition).update(value=F('value') + n)
+
+
+def record_visits(visits):
+    """Count freshly created visits, e.g. after a bulk_create which sends no signals"""
+    deltas = Counter()
+    for visit in visits:
+        deltas.update(visit_counters(visit))
+    apply(deltas)
+
+
+def dashboard(scope, scope_id=0):
+    """Totals and chart data of one scope, read in a single query"""
+    today = f'visits:{timezone.localdate()}'
+    counters = dict(
+        DashboardCounter.objects
+        .filter(scope=scope, scope_id=scope_id or 0)
+        .filter(Q(key__in=['visits', 'transfers', today]) | Q(key__startswith='classification:') | Q(key__startswith='status:'))
+        .values_list('key', 'value')
+    )
+
+    def chart(prefix, choices):
+        labels = [value for value, _ in choices if counters.get(f'{prefix}:{value}')]
+        return {'labels': labels, 'counts': [counters[f'{prefix}:{label}'] for label in labels]}
+
+    return {
+        'total_patient': counters.get('visits', 0),
+        'total_transfer': counters.get('transfers', 0),
+        'today_patient': counters.get(today, 0),
+        'visit_chart_data': (
+            chart('classification', Visit.DIAGNIZE_CLASS),
+            chart('status', Visit.STATUS_CHOICES),
+        ),
+    }
+
+
+@transaction.atomic
+def rebuild():
+    """Recompute every counter from the visit and transfer tables"""
+    deltas = Counter()
+    rows = (
+        Visit.objects
+        .annotate(day=TruncDate('date'))
+        .values('community_work_id', 'health_facility_id', 'day', 'diagnize_classification', 'status')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    for row in rows:
+        for scope, scope_id in _scopes(row['community_work_id'], row['health_facility_id']):
+            for key in _visit_keys(row['day'], row['diagnize_classification'], row['status']):
+                deltas[(scope, scope_id, key)] += row['n']
+
+    rows = Transfer.objects.values('visit__community_work_id', 'from_health_facility_id').annotate(n=Count('id')).order_by()
+    for row in rows:
+        for scope, scope_id in _scopes(row['visit__community_work_id'], row['from_health_facility_id']):
+            deltas[(scope, scope_id, 'transfers')] += row['n']
+
+    DashboardCounter.objects.all().delete()
+    DashboardCounter.objects.bulk_create(
+        [DashboardCounter(scope=scope, scope_id=scope_id, key=key, value=n) for (scope, scope_id, key), n in deltas.items()],
+        batch_size=1000,
+    )
+    return len(deltas)
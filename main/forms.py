@@ -1,9 +1,11 @@
 from .models import CommunityWork, Patient, Doctor, Appointment, HealthFacility, User, Visit
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
-from location.models import Sector, Cell, Village
+from location.forms import LocationFormMixin
+from .widgets import AutocompleteSelect
+from .autocomplete import patient_label, community_work_label
 from django.urls import reverse_lazy
-from django.forms import inlineformset_factory
+from django.forms import inlineformset_factory, formset_factory, BaseFormSet
 
 
 
@@ -29,11 +31,11 @@ class CustomUserCreationForm(UserCreationForm):
             'role': forms.Select(
                 attrs={"class": "form-control select2"}
             ),
-            'chw_assigned': forms.Select(
-                attrs={"class": "form-control select2"}
+            'chw_assigned': AutocompleteSelect(
+                reverse_lazy("autocomplete", args=["community-workers"]), attrs={"class": "form-control"}, label=community_work_label,
             ),
-            'health_facility_assigned': forms.Select(
-                attrs={"class": "form-control select2"}
+            'health_facility_assigned': AutocompleteSelect(
+                reverse_lazy("autocomplete", args=["health-facilities"]), attrs={"class": "form-control"},
             ),
             
         }
@@ -46,7 +48,9 @@ class CustomUserCreationForm(UserCreationForm):
         self.fields['health_facility_assigned'].required = False
 
 
-class PatientForm(forms.ModelForm):
+class PatientForm(LocationFormMixin, forms.ModelForm):
+    # shown once possible duplicates were found, see AddPatientView
+    confirm_new = forms.BooleanField(required=False, label="None of these, register a new patient")
 
     class Meta:
         model = Patient
@@ -63,16 +67,16 @@ class PatientForm(forms.ModelForm):
                 attrs={"class":"form-control", "placeholder":"Last Name"},
             ),
             "district": forms.Select(
-                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-sector"), "hx-target":"#id_sector"},
+                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-sector"), "hx-target":"#id_sector", "data-location-level": "district", "data-location-bundle": reverse_lazy("location-bundle")},
             ),
             "sector": forms.Select(
-                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-cell"), "hx-target":"#id_cell"},
+                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-cell"), "hx-target":"#id_cell", "data-location-level": "sector"},
             ),
             "cell": forms.Select(
-                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-village"), "hx-target":"#id_village"},
+                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-village"), "hx-target":"#id_village", "data-location-level": "cell"},
             ),
             "village": forms.Select(
-                attrs={"class": "form-control select2"},
+                attrs={"class": "form-control select2", "data-location-level": "village"},
             ),
             "phone_number": forms.TextInput(
                 attrs={"class":"form-control", "placeholder":"Phone Number"},
@@ -89,21 +93,6 @@ class PatientForm(forms.ModelForm):
             
         }
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.fields['sector'].queryset = Sector.objects.none()
-        self.fields['cell'].queryset = Cell.objects.none()
-        self.fields['village'].queryset = Village.objects.none()
-
-        if 'district' in self.data:
-            district_id = int(self.data.get("district"))
-            self.fields['sector'].queryset = Sector.objects.filter(district=district_id)
-        if 'sector' in self.data:
-            sector_id = int(self.data.get("sector"))
-            self.fields['cell'].queryset = Cell.objects.filter(sector=sector_id)
-        if 'cell' in self.data:
-            cell_id = int(self.data.get("cell"))
-            self.fields['village'].queryset = Village.objects.filter(cell=cell_id)
         
 
 class VisitForm(forms.ModelForm):
@@ -113,8 +102,8 @@ class VisitForm(forms.ModelForm):
         fields = ['patient', 'disease','community_work', 'weight', 'bmi', 'health_facility', 'diagnize_classification']
 
         widgets = {
-            "patient": forms.Select(
-                attrs={"class":"form-control select2"},
+            "patient": AutocompleteSelect(
+                reverse_lazy("autocomplete", args=["patients"]), attrs={"class":"form-control"}, label=patient_label,
             ),
             "disease": forms.TextInput(
                 attrs={"class":"form-control", "placeholder":"Disease"},
@@ -125,8 +114,8 @@ class VisitForm(forms.ModelForm):
             "bmi": forms.NumberInput(
                 attrs={"class":"form-control", "placeholder":"BMI"},
             ),
-            "community_work": forms.Select(
-                attrs={"class": "form-control select2"},
+            "community_work": AutocompleteSelect(
+                reverse_lazy("autocomplete", args=["community-workers"]), attrs={"class": "form-control"}, label=community_work_label,
             ),
             "health_facility": forms.Select(
                 attrs={"class": "form-control select2"},
@@ -141,7 +130,89 @@ class VisitForm(forms.ModelForm):
         self.fields['health_facility'].queryset = HealthFacility.objects.filter(status='health_center')
 
 
-class CommunityWorkForm(forms.ModelForm):
+class VisitBatchForm(forms.ModelForm):
+    """
+    One row of a batch of visits. The related objects are entered as ids and
+    resolved for the whole batch at once by BaseVisitBatchFormSet.clean().
+    """
+    patient = forms.IntegerField(widget=AutocompleteSelect(
+        reverse_lazy("autocomplete", args=["patients"]), attrs={"class": "form-control"},
+        queryset=Patient.objects.all(), label=patient_label,
+    ))
+    community_work = forms.IntegerField(required=False, widget=forms.HiddenInput)
+    health_facility = forms.IntegerField(required=False, widget=forms.HiddenInput)
+
+    class Meta:
+        model = Visit
+        fields = ['disease', 'weight', 'bmi', 'diagnize_classification']
+
+        widgets = {
+            "disease": forms.TextInput(
+                attrs={"class":"form-control", "placeholder":"Disease"},
+            ),
+            "weight": forms.NumberInput(
+                attrs={"class":"form-control", "placeholder":"Weight"},
+            ),
+            "bmi": forms.NumberInput(
+                attrs={"class":"form-control", "placeholder":"BMI"},
+            ),
+            "diagnize_classification": forms.Select(
+                attrs={"class": "form-control"},
+            ),
+        }
+
+
+class BaseVisitBatchFormSet(BaseFormSet):
+    """
+    Validates a batch of visits with one query per related model. Pass the
+    ``community_work``/``health_facility`` id to force them on every visit,
+    e.g. the CHW or facility of the user entering the batch.
+    """
+
+    def __init__(self, *args, community_work=None, health_facility=None, **kwargs):
+        self.community_work = community_work
+        self.health_facility = health_facility
+        super().__init__(*args, **kwargs)
+
+    def clean(self):
+        if any(self.errors):
+            return
+        rows = [form for form in self.forms if form.has_changed() and form.cleaned_data]
+        if not rows:
+            raise forms.ValidationError("Enter at least one visit.")
+        forced = {'community_work': self.community_work, 'health_facility': self.health_facility}
+        choices = {
+            'patient': Patient.objects.all(),
+            'community_work': CommunityWork.objects.all(),
+            'health_facility': HealthFacility.objects.filter(status='health_center'),
+        }
+        related = {}
+        for name, queryset in choices.items():
+            if forced.get(name) is not None:
+                related[name] = queryset.model.objects.in_bulk([forced[name]])
+            else:
+                related[name] = queryset.in_bulk({form.cleaned_data[name] for form in rows if form.cleaned_data[name]})
+        for form in rows:
+            for name, objects in related.items():
+                pk = forced.get(name) or form.cleaned_data[name]
+                if pk and pk not in objects:
+                    form.add_error(name, "Select a valid choice. That choice is not one of the available choices.")
+                elif pk:
+                    setattr(form.instance, name, objects[pk])
+        if any(self.errors):
+            raise forms.ValidationError("Some visits are not valid.")
+
+    def visits(self):
+        """The unsaved visits of a valid batch"""
+        return [form.instance for form in self.forms if form.has_changed() and form.cleaned_data]
+
+
+VisitBatchFormSet = formset_factory(
+    VisitBatchForm, formset=BaseVisitBatchFormSet, extra=10, max_num=200, validate_max=True,
+)
+
+
+class CommunityWorkForm(LocationFormMixin, forms.ModelForm):
 
     class Meta:
         model = CommunityWork
@@ -158,16 +229,16 @@ class CommunityWorkForm(forms.ModelForm):
                 attrs={"class":"form-control", "placeholder":"Last Name"},
             ),
             "district": forms.Select(
-                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-sector"), "hx-target":"#id_sector"},
+                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-sector"), "hx-target":"#id_sector", "data-location-level": "district", "data-location-bundle": reverse_lazy("location-bundle")},
             ),
             "sector": forms.Select(
-                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-cell"), "hx-target":"#id_cell"},
+                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-cell"), "hx-target":"#id_cell", "data-location-level": "sector"},
             ),
             "cell": forms.Select(
-                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-village"), "hx-target":"#id_village"},
+                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-village"), "hx-target":"#id_village", "data-location-level": "cell"},
             ),
             "village": forms.Select(
-                attrs={"class": "form-control select2"},
+                attrs={"class": "form-control select2", "data-location-level": "village"},
             ),
             "phone_number": forms.TextInput(
                 attrs={"class":"form-control", "placeholder":"Last Name"},
@@ -181,24 +252,9 @@ class CommunityWorkForm(forms.ModelForm):
             ),
         }
     
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.fields['sector'].queryset = Sector.objects.none()
-        self.fields['cell'].queryset = Cell.objects.none()
-        self.fields['village'].queryset = Village.objects.none()
-
-        if 'district' in self.data:
-            district_id = int(self.data.get("district"))
-            self.fields['sector'].queryset = Sector.objects.filter(district=district_id)
-        if 'sector' in self.data:
-            sector_id = int(self.data.get("sector"))
-            self.fields['cell'].queryset = Cell.objects.filter(sector=sector_id)
-        if 'cell' in self.data:
-            cell_id = int(self.data.get("cell"))
-            self.fields['village'].queryset = Village.objects.filter(cell=cell_id)
 
 
-class DoctorForm(forms.ModelForm):
+class DoctorForm(LocationFormMixin, forms.ModelForm):
 
     class Meta:
         model = Doctor
@@ -215,16 +271,16 @@ class DoctorForm(forms.ModelForm):
                 attrs={"class":"form-control", "placeholder":"Last Name"},
             ),
             "district": forms.Select(
-                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-sector"), "hx-target":"#id_sector"},
+                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-sector"), "hx-target":"#id_sector", "data-location-level": "district", "data-location-bundle": reverse_lazy("location-bundle")},
             ),
             "sector": forms.Select(
-                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-cell"), "hx-target":"#id_cell"},
+                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-cell"), "hx-target":"#id_cell", "data-location-level": "sector"},
             ),
             "cell": forms.Select(
-                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-village"), "hx-target":"#id_village"},
+                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-village"), "hx-target":"#id_village", "data-location-level": "cell"},
             ),
             "village": forms.Select(
-                attrs={"class": "form-control select2"},
+                attrs={"class": "form-control select2", "data-location-level": "village"},
             ),
             "phone_number": forms.TextInput(
                 attrs={"class":"form-control", "placeholder":"Last Name"},
@@ -237,24 +293,9 @@ class DoctorForm(forms.ModelForm):
                 attrs={"class": "form-control"},
             ),
         }
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.fields['sector'].queryset = Sector.objects.none()
-        self.fields['cell'].queryset = Cell.objects.none()
-        self.fields['village'].queryset = Village.objects.none()
-
-        if 'district' in self.data:
-            district_id = int(self.data.get("district"))
-            self.fields['sector'].queryset = Sector.objects.filter(district=district_id)
-        if 'sector' in self.data:
-            sector_id = int(self.data.get("sector"))
-            self.fields['cell'].queryset = Cell.objects.filter(sector=sector_id)
-        if 'cell' in self.data:
-            cell_id = int(self.data.get("cell"))
-            self.fields['village'].queryset = Village.objects.filter(cell=cell_id)
 
 
-class HealthFacilityForm(forms.ModelForm):
+class HealthFacilityForm(LocationFormMixin, forms.ModelForm):
 
     class Meta:
         model = HealthFacility
@@ -265,16 +306,16 @@ class HealthFacilityForm(forms.ModelForm):
                 attrs={"class":"form-control", "placeholder":"First Name"},
             ),
             "district": forms.Select(
-                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-sector"), "hx-target":"#id_sector"},
+                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-sector"), "hx-target":"#id_sector", "data-location-level": "district", "data-location-bundle": reverse_lazy("location-bundle")},
             ),
             "sector": forms.Select(
-                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-cell"), "hx-target":"#id_cell"},
+                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-cell"), "hx-target":"#id_cell", "data-location-level": "sector"},
             ),
             "cell": forms.Select(
-                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-village"), "hx-target":"#id_village"},
+                attrs={"class": "form-control select2", "hx-get":reverse_lazy("load-village"), "hx-target":"#id_village", "data-location-level": "cell"},
             ),
             "village": forms.Select(
-                attrs={"class": "form-control select2"},
+                attrs={"class": "form-control select2", "data-location-level": "village"},
             ),
             "director": forms.Select(
                 attrs={"class": "form-control select2"},
@@ -291,21 +332,6 @@ class HealthFacilityForm(forms.ModelForm):
             ),
         }
     
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.fields['sector'].queryset = Sector.objects.none()
-        self.fields['cell'].queryset = Cell.objects.none()
-        self.fields['village'].queryset = Village.objects.none()
-
-        if 'district' in self.data:
-            district_id = int(self.data.get("district"))
-            self.fields['sector'].queryset = Sector.objects.filter(district=district_id)
-        if 'sector' in self.data:
-            sector_id = int(self.data.get("sector"))
-            self.fields['cell'].queryset = Cell.objects.filter(sector=sector_id)
-        if 'cell' in self.data:
-            cell_id = int(self.data.get("cell"))
-            self.fields['village'].queryset = Village.objects.filter(cell=cell_id)
 
 
 class AppointmentForm(forms.ModelForm):
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from main import notifications, send_sms
+from main.models import Notification
+
+
+class SimulatedBackend:
+    """SMS backend that only waits, standing in for the provider's round trip"""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def send(self, phone_number, message):
+        time.sleep(self.latency)
+
+    async def asend(self, phone_number, message):
+        await asyncio.sleep(self.latency)
+
+    async def aclose(self):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Compare sequential and concurrent outbox delivery against a simulated SMS provider; nothing is sent or kept'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200)
+        parser.add_argument('--latency', type=float, default=0.2, help='Seconds per simulated SMS request')
+        parser.add_argument('--concurrency', type=int, default=20)
+
+    def handle(self, *args, **options):
+        count = options['count']
+        backend, limiter = send_sms._backend, notifications._sms_limiter
+        send_sms._backend = SimulatedBackend(options['latency'])
+        notifications._sms_limiter = notifications.RateLimiter(0)
+        try:
+            with override_settings(SMS_RATE_LIMIT=0), transaction.atomic():
+                # keep real notifications out of the benchmark, the rollback restores them
+                Notification.objects.filter(status=Notification.PENDING).update(status=Notification.DEAD)
+                for label, run in (
+                    ('sequential', lambda: notifications.process(count)),
+                    (f'concurrent x{options["concurrency"]}', lambda: notifications.process_concurrently(count, options['concurrency'])),
+                ):
+                    Notification.objects.bulk_create(
+                        [Notification(channel=Notification.SMS, recipient='+250780000000', body='benchmark') for _ in range(count)]
+                    )
+                    started = time.perf_counter()
+                    sent, failed = run()
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(f'{label}: {sent} sent, {failed} failed in {elapsed:.2f}s ({sent / elapsed:.0f}/s)')
+                transaction.set_rollback(True)
+        finally:
+            send_sms._backend, notifications._sms_limiter = backend, limiter
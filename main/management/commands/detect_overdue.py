@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from main.overdue import detect
+
+
+class Command(BaseCommand):
+    help = 'Compute transfer delays and flag overdue transfers and missed appointments; run it from cron, e.g. hourly'
+
+    def handle(self, *args, **kwargs):
+        stats = detect()
+        self.stdout.write(self.style.SUCCESS(', '.join(f'{key.replace("_", " ")}: {value}' for key, value in stats.items())))
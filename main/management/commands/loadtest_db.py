@@ -0,0 +1,102 @@
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Max
+
+from main.models import Notification, Visit
+from main.visits import create_visits
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the write throughput of the configured database: threads submit visits like CHWs '
+        'do, through create_visits. The visits and their notifications are deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--batch-size', type=int, default=1, help='Visits per submission')
+        parser.add_argument('--keep', action='store_true', help='Keep the visits that were written')
+
+    def handle(self, *args, **options):
+        # copy existing visits so the load touches real counters and no new patient access
+        templates = list(
+            Visit.objects.select_related('patient', 'community_work', 'health_facility')
+            .filter(patient__isnull=False).order_by('-id')[:500]
+        )
+        if not templates:
+            raise CommandError('The load test copies existing visits, there are none')
+        last_visit = Visit.objects.aggregate(Max('id'))['id__max']
+        last_notification = Notification.objects.aggregate(Max('id'))['id__max'] or 0
+
+        latencies, errors = [], Counter()
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options['seconds']
+
+        def submit():
+            try:
+                while time.perf_counter() < deadline:
+                    visits = [
+                        Visit(
+                            patient=template.patient, community_work=template.community_work,
+                            health_facility=template.health_facility, disease='load test', weight=template.weight,
+                            bmi=template.bmi, diagnize_classification=template.diagnize_classification,
+                        )
+                        for template in random.sample(templates, min(options['batch_size'], len(templates)))
+                    ]
+                    started = time.perf_counter()
+                    try:
+                        create_visits(visits)
+                    except OperationalError as e:
+                        with lock:
+                            errors[str(e)] += 1
+                        continue
+                    with lock:
+                        latencies.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+
+        self.stdout.write(f'{connection.vendor}: {self.describe()}')
+        threads = [threading.Thread(target=submit) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        written = len(latencies) * options['batch_size']
+        self.stdout.write(
+            f'{len(latencies)} submissions ({written} visits) by {options["threads"]} threads in {elapsed:.1f}s: '
+            f'{len(latencies) / elapsed:.0f} submissions/s, {written / elapsed:.0f} visits/s'
+        )
+        if latencies:
+            cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+            self.stdout.write(
+                f'latency p50 {cuts[49] * 1000:.1f}ms, p95 {cuts[94] * 1000:.1f}ms, p99 {cuts[98] * 1000:.1f}ms'
+            )
+        for message, count in errors.items():
+            self.stdout.write(self.style.ERROR(f'{count} failed: {message}'))
+
+        if not options['keep']:
+            # one by one through the signals, which take the visits back out of the counters
+            for visit in Visit.objects.filter(id__gt=last_visit).iterator():
+                visit.delete()
+            Notification.objects.filter(id__gt=last_notification).delete()
+
+    def describe(self):
+        settings_dict = connection.settings_dict
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                pragmas = {
+                    name: cursor.execute(f'PRAGMA {name}').fetchone()[0]
+                    for name in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size')
+                }
+            return ', '.join(f'{name}={value}' for name, value in pragmas.items())
+        return f'CONN_MAX_AGE={settings_dict["CONN_MAX_AGE"]}, CONN_HEALTH_CHECKS={settings_dict["CONN_HEALTH_CHECKS"]}'
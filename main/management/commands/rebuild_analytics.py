@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from main.analytics import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily visit rollups used by the analytics charts'
+
+    def handle(self, *args, **kwargs):
+        count = rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} visit rollups'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from main.dashboard import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the dashboard counters from the visit and transfer tables'
+
+    def handle(self, *args, **kwargs):
+        count = rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} dashboard counters'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from main.membership import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute which CHWs and facilities may see each patient from registrations, visits and transfers'
+
+    def handle(self, *args, **kwargs):
+        count = rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Granted {count} patient accesses'))
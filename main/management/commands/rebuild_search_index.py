@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from main.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the patient search index from the patient table'
+
+    def handle(self, *args, **kwargs):
+        count = get_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} patients'))
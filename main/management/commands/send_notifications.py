@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from main.notifications import process, process_concurrently
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued SMS and email notifications, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Send one batch and exit')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--concurrency', type=int, default=1, help='SMS sent at the same time (asyncio)')
+
+    def handle(self, *args, **options):
+        while True:
+            if options['concurrency'] > 1:
+                sent, failed = process_concurrently(options['batch_size'], options['concurrency'])
+            else:
+                sent, failed = process(options['batch_size'])
+            if sent or failed:
+                self.stdout.write(f'Sent {sent} notifications, {failed} failed')
+            if options['once']:
+                break
+            if not (sent or failed):
+                time.sleep(options['interval'])
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from main.reminders import send_reminders
+
+
+class Command(BaseCommand):
+    help = 'Queue appointment reminders for the coming hours; run it from cron, e.g. hourly'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, help='Size of the reminder window (default: REMINDER_WINDOW_HOURS)')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--dry-run', action='store_true', help='Count what would be queued without queueing it')
+
+    def handle(self, *args, **options):
+        stats = send_reminders(hours=options['hours'], chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['appointments']} appointments: {stats['sms']} SMS and {stats['digests']} digests queued, "
+            f"{stats['no_phone']} patients without a phone number"
+        ))
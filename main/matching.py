@@ -0,0 +1,44 @@
+from django.db.models import Q
+
+from .models import Patient
+from .normalize import normalize_phone, name_key, phonetic_key
+
+# what each kind of agreement adds to a candidate's score
+WEIGHTS = {'phone': 3, 'name': 2, 'phonetic': 1}
+
+
+def identity_match(identity):
+    """The patient registered with this national ID, on the unique index"""
+    identity = (identity or '').strip()
+    if identity:
+        return Patient.objects.filter(identity=identity).first()
+
+
+def candidates(first_name, last_name, phone_number, exclude=None, limit=5):
+    """
+    Patients who may be the same person: same normalized phone number, same
+    name words or names that sound alike. Each condition is one indexed
+    lookup on keys computed in Patient.save(). Returns (patient, reasons)
+    pairs, best match first.
+    """
+    keys = {
+        'phone': ('phone_key', normalize_phone(phone_number)),
+        'name': ('name_key', name_key(first_name, last_name)),
+        'phonetic': ('phonetic_key', phonetic_key(first_name, last_name)),
+    }
+    condition = Q()
+    for field, value in keys.values():
+        if value:
+            condition |= Q(**{field: value})
+    if not condition:
+        return []
+    queryset = Patient.objects.filter(condition).select_related('health_facility', 'village')
+    if exclude is not None:
+        queryset = queryset.exclude(pk=exclude)
+
+    matches = []
+    for patient in queryset[:50]:
+        reasons = [reason for reason, (field, value) in keys.items() if value and getattr(patient, field) == value]
+        matches.append((patient, reasons))
+    matches.sort(key=lambda match: -sum(WEIGHTS[reason] for reason in match[1]))
+    return matches[:limit]
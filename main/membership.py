@@ -0,0 +1,65 @@
+from django.db import transaction
+
+from .models import Patient, PatientAccess, Transfer, Visit
+
+# Maintains PatientAccess. Rows are only added when registrations, visits and
+# transfers are saved: a CHW or facility that saw a patient once keeps seeing
+# her. rebuild() recomputes the table from scratch.
+
+CHW, FACILITY = PatientAccess.CHW, PatientAccess.FACILITY
+
+
+def patient_pairs(patient):
+    if patient.health_facility_id:
+        yield FACILITY, patient.health_facility_id, patient.pk
+
+
+def visit_pairs(visit):
+    # a visit may have no patient: it gives no access to anyone
+    if visit.patient_id is None:
+        return
+    if visit.community_work_id:
+        yield CHW, visit.community_work_id, visit.patient_id
+    if visit.health_facility_id:
+        yield FACILITY, visit.health_facility_id, visit.patient_id
+
+
+def transfer_pairs(transfer, patient_id):
+    if patient_id is None:
+        return
+    yield FACILITY, transfer.from_health_facility_id, patient_id
+    yield FACILITY, transfer.to_hospital_id, patient_id
+
+
+def grant(pairs):
+    """Add the (scope, scope_id, patient_id) ``pairs`` that are missing"""
+    PatientAccess.objects.bulk_create(
+        [PatientAccess(scope=scope, scope_id=scope_id, patient_id=patient_id) for scope, scope_id, patient_id in set(pairs)],
+        ignore_conflicts=True, batch_size=1000,
+    )
+
+
+def grant_visits(visits):
+    grant(pair for visit in visits for pair in visit_pairs(visit))
+
+
+def all_pairs():
+    for facility_id, patient_id in Patient.objects.filter(health_facility__isnull=False).values_list('health_facility', 'id').iterator():
+        yield FACILITY, facility_id, patient_id
+    for patient_id, community_work_id, facility_id in Visit.objects.filter(patient__isnull=False).values_list('patient', 'community_work', 'health_facility').iterator():
+        if community_work_id:
+            yield CHW, community_work_id, patient_id
+        if facility_id:
+            yield FACILITY, facility_id, patient_id
+    transfers = Transfer.objects.filter(visit__patient__isnull=False).values_list('from_health_facility', 'to_hospital', 'visit__patient')
+    for from_id, to_id, patient_id in transfers.iterator():
+        yield FACILITY, from_id, patient_id
+        yield FACILITY, to_id, patient_id
+
+
+@transaction.atomic
+def rebuild():
+    PatientAccess.objects.all().delete()
+    pairs = set(all_pairs())
+    grant(pairs)
+    return len(pairs)
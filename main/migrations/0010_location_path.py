@@ -0,0 +1,54 @@
+# Generated by Django 5.0.7 on 2026-10-18 11:57
+
+from django.db import migrations, models
+
+
+def location_path(district_id=None, sector_id=None, cell_id=None, village_id=None):
+    # copy of location.models.location_path as of this migration
+    path = '/'
+    for pk in (district_id, sector_id, cell_id, village_id):
+        if pk is None:
+            break
+        path += f'{pk}/'
+    return path if path != '/' else ''
+
+
+def fill_location_path(apps, schema_editor):
+    for model_name in ('Patient', 'HealthFacility', 'Doctor', 'CommunityWork'):
+        model = apps.get_model('main', model_name)
+        rows = model.objects.values_list('id', 'district_id', 'sector_id', 'cell_id', 'village_id')
+        model.objects.bulk_update(
+            [model(id=pk, location_path=location_path(*ids)) for pk, *ids in rows],
+            ['location_path'], batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_communitywork_email_healthfacility_email_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='communitywork',
+            name='location_path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='doctor',
+            name='location_path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='healthfacility',
+            name='location_path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='location_path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(fill_location_path, migrations.RunPython.noop),
+    ]
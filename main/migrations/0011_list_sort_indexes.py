@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_location_path'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transfer',
+            name='transfer_date',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='visit',
+            name='date',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.0.7 on 2026-10-18 12:02
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+# the counters of main.dashboard.rebuild() when this migration was written
+
+def scopes(community_work_id, health_facility_id):
+    found = [('national', 0)]
+    if community_work_id:
+        found.append(('chw', community_work_id))
+    if health_facility_id:
+        found.append(('facility', health_facility_id))
+    return found
+
+
+def fill_dashboard_counters(apps, schema_editor):
+    Visit = apps.get_model('main', 'Visit')
+    Transfer = apps.get_model('main', 'Transfer')
+    DashboardCounter = apps.get_model('main', 'DashboardCounter')
+    totals = Counter()
+    rows = (
+        Visit.objects
+        .annotate(day=TruncDate('date'))
+        .values('community_work_id', 'health_facility_id', 'day', 'diagnize_classification', 'status')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    for row in rows:
+        keys = ['visits', f"visits:{row['day']}", f"classification:{row['diagnize_classification']}", f"status:{row['status']}"]
+        for scope, scope_id in scopes(row['community_work_id'], row['health_facility_id']):
+            for key in keys:
+                totals[(scope, scope_id, key)] += row['n']
+    rows = Transfer.objects.values('visit__community_work_id', 'from_health_facility_id').annotate(n=Count('id')).order_by()
+    for row in rows:
+        for scope, scope_id in scopes(row['visit__community_work_id'], row['from_health_facility_id']):
+            totals[(scope, scope_id, 'transfers')] += row['n']
+    DashboardCounter.objects.bulk_create(
+        [DashboardCounter(scope=scope, scope_id=scope_id, key=key, value=n) for (scope, scope_id, key), n in totals.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_list_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('national', 'National'), ('chw', 'Community Health Worker'), ('facility', 'Health Facility')], max_length=10)),
+                ('scope_id', models.PositiveBigIntegerField(default=0)),
+                ('key', models.CharField(max_length=50)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dashboardcounter',
+            constraint=models.UniqueConstraint(fields=('scope', 'scope_id', 'key'), name='unique_dashboard_counter'),
+        ),
+        migrations.RunPython(fill_dashboard_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.0.7 on 2026-10-18 12:04
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def fill_visit_rollups(apps, schema_editor):
+    # main.analytics.rebuild() when this migration was written
+    Visit = apps.get_model('main', 'Visit')
+    VisitRollup = apps.get_model('main', 'VisitRollup')
+    rows = (
+        Visit.objects
+        .annotate(day=TruncDate('date'))
+        .values('day', 'health_facility_id', 'community_work_id', 'patient__district_id', 'diagnize_classification', 'status')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    rollups = Counter()
+    for row in rows:
+        key = (
+            row['day'], row['health_facility_id'] or 0, row['community_work_id'] or 0, row['patient__district_id'] or 0,
+            row['diagnize_classification'], row['status'],
+        )
+        rollups[key] += row['n']
+    fields = ['day', 'health_facility_id', 'community_work_id', 'district_id', 'diagnize_classification', 'status']
+    VisitRollup.objects.bulk_create(
+        [VisitRollup(**dict(zip(fields, key)), count=n) for key, n in rollups.items()], batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_dashboardcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('health_facility_id', models.PositiveBigIntegerField(default=0)),
+                ('community_work_id', models.PositiveBigIntegerField(default=0)),
+                ('district_id', models.PositiveBigIntegerField(default=0)),
+                ('diagnize_classification', models.CharField(max_length=10)),
+                ('status', models.CharField(max_length=10)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['health_facility_id', 'day'], name='main_visitr_health__604ad0_idx'), models.Index(fields=['community_work_id', 'day'], name='main_visitr_communi_6b2675_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='visitrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'health_facility_id', 'community_work_id', 'district_id', 'diagnize_classification', 'status'), name='unique_visit_rollup'),
+        ),
+        migrations.RunPython(fill_visit_rollups, migrations.RunPython.noop),
+    ]
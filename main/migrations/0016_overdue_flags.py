@@ -0,0 +1,28 @@
+# Generated by Django 5.0.7 on 2026-10-18 12:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_appointment_reminders'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='missed',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.AddField(
+            model_name='transfer',
+            name='overdue',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.AlterField(
+            model_name='transfer',
+            name='delay_in_hours',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
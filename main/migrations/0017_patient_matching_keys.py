@@ -0,0 +1,91 @@
+# Generated by Django 5.0.7 on 2026-10-18 12:12
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+# the keys as main/normalize.py computed them when this migration was written,
+# copied so that later changes to the live module don't change the migration
+
+SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'), **dict.fromkeys('cgjkqsxz', '2'), **dict.fromkeys('dt', '3'),
+    'l': '4', **dict.fromkeys('mn', '5'), 'r': '6',
+}
+
+
+def normalize_phone(phone_number):
+    digits = re.sub(r'\D', '', phone_number or '')
+    return digits[-9:]
+
+
+def ascii_lower(*names):
+    text = unicodedata.normalize('NFKD', ' '.join(name or '' for name in names))
+    return text.encode('ascii', 'ignore').decode().lower()
+
+
+def name_tokens(*names):
+    return sorted(re.findall(r'[a-z]+', ascii_lower(*names)))
+
+
+def soundex(word):
+    if not word:
+        return ''
+    code = word[0].upper()
+    previous = SOUNDEX_CODES.get(word[0], '')
+    for letter in word[1:]:
+        digit = SOUNDEX_CODES.get(letter, '')
+        if digit and digit != previous:
+            code += digit
+        if letter not in 'hw':
+            previous = digit
+    return (code + '000')[:4]
+
+
+def name_key(first_name, last_name):
+    return ' '.join(name_tokens(first_name, last_name))
+
+
+def phonetic_key(first_name, last_name):
+    return ' '.join(sorted(soundex(token) for token in name_tokens(first_name, last_name)))
+
+
+def fill_matching_keys(apps, schema_editor):
+    Patient = apps.get_model('main', 'Patient')
+    rows = Patient.objects.values_list('id', 'first_name', 'last_name', 'phone_number')
+    Patient.objects.bulk_update(
+        [
+            Patient(
+                id=pk, phone_key=normalize_phone(phone_number), name_key=name_key(first_name, last_name),
+                phonetic_key=phonetic_key(first_name, last_name)[:50],
+            )
+            for pk, first_name, last_name, phone_number in rows
+        ],
+        ['phone_key', 'name_key', 'phonetic_key'], batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_overdue_flags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='name_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='phone_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=13),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='phonetic_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=50),
+        ),
+        migrations.RunPython(fill_matching_keys, migrations.RunPython.noop),
+    ]
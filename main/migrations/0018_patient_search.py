@@ -0,0 +1,36 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS patient_search USING fts5("
+        "names, identity, phone, village, facility, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    # same documents as SQLiteFTSBackend.document(), built in one statement
+    schema_editor.execute(
+        "INSERT INTO patient_search (rowid, names, identity, phone, village, facility) "
+        "SELECT p.id, p.first_name || ' ' || COALESCE(p.middle_name || ' ', '') || p.last_name, "
+        "COALESCE(p.identity, ''), p.phone_number || ' ' || p.phone_key, COALESCE(v.name, ''), "
+        "CASE WHEN p.health_facility_id IS NULL THEN '' ELSE 'f' || p.health_facility_id END "
+        "FROM main_patient p LEFT JOIN location_village v ON v.id = p.village_id"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS patient_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_patient_matching_keys'),
+        ('location', '0003_locationsync'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
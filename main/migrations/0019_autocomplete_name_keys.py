@@ -0,0 +1,54 @@
+# Generated by Django 5.0.7 on 2026-10-18 12:16
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+
+def search_key(*names):
+    # main.normalize.search_key when this migration was written
+    text = unicodedata.normalize('NFKD', ' '.join(name or '' for name in names))
+    return ' '.join(re.findall(r'[a-z0-9]+', text.encode('ascii', 'ignore').decode().lower()))
+
+
+def fill_name_keys(apps, schema_editor):
+    HealthFacility = apps.get_model('main', 'HealthFacility')
+    HealthFacility.objects.bulk_update(
+        [HealthFacility(id=pk, name_key=search_key(name)) for pk, name in HealthFacility.objects.values_list('id', 'name')],
+        ['name_key'], batch_size=1000,
+    )
+    CommunityWork = apps.get_model('main', 'CommunityWork')
+    CommunityWork.objects.bulk_update(
+        [
+            CommunityWork(id=pk, name_key=search_key(first_name, last_name), surname_key=search_key(last_name, first_name))
+            for pk, first_name, last_name in CommunityWork.objects.values_list('id', 'first_name', 'last_name')
+        ],
+        ['name_key', 'surname_key'], batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0018_patient_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='communitywork',
+            name='name_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='communitywork',
+            name='surname_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='healthfacility',
+            name='name_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_name_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.0.7 on 2026-10-18 12:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_patient_access(apps, schema_editor):
+    Patient = apps.get_model('main', 'Patient')
+    Visit = apps.get_model('main', 'Visit')
+    Transfer = apps.get_model('main', 'Transfer')
+    PatientAccess = apps.get_model('main', 'PatientAccess')
+    pairs = set()
+    for facility_id, patient_id in Patient.objects.filter(health_facility__isnull=False).values_list('health_facility', 'id').iterator():
+        pairs.add(('facility', facility_id, patient_id))
+    for patient_id, community_work_id, facility_id in Visit.objects.filter(patient__isnull=False).values_list('patient', 'community_work', 'health_facility').iterator():
+        if community_work_id:
+            pairs.add(('chw', community_work_id, patient_id))
+        if facility_id:
+            pairs.add(('facility', facility_id, patient_id))
+    transfers = Transfer.objects.filter(visit__patient__isnull=False).values_list('from_health_facility', 'to_hospital', 'visit__patient')
+    for from_id, to_id, patient_id in transfers.iterator():
+        pairs.add(('facility', from_id, patient_id))
+        pairs.add(('facility', to_id, patient_id))
+    PatientAccess.objects.bulk_create(
+        [PatientAccess(scope=scope, scope_id=scope_id, patient_id=patient_id) for scope, scope_id, patient_id in pairs],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0019_autocomplete_name_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('chw', 'Community Health Worker'), ('facility', 'Health Facility')], max_length=10)),
+                ('scope_id', models.PositiveBigIntegerField()),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access', to='main.patient')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='patientaccess',
+            constraint=models.UniqueConstraint(fields=('scope', 'scope_id', 'patient'), name='unique_patient_access'),
+        ),
+        migrations.RunPython(fill_patient_access, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.7 on 2026-10-18 12:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0020_patient_access'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['first_name', 'id'], name='main_patien_first_n_d119d9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['last_name', 'id'], name='main_patien_last_na_71ea1c_idx'),
+        ),
+    ]
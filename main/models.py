@@ -3,13 +3,14 @@ from django.utils.translation import gettext_lazy as _
 from django.core.validators import RegexValidator
 from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.utils import timezone
-from location.models import District, Sector, Cell, Village
+from location.models import District, Sector, Cell, Village, LocationPathMixin, LocatedQuerySet
 from django.urls import reverse
+from .normalize import normalize_phone, name_key, phonetic_key, search_key
 
 
 
 
-class Patient(models.Model):
+class Patient(LocationPathMixin):
     first_name = models.CharField(max_length=100, blank=False, null=False)
     middle_name = models.CharField(max_length=100, blank=True, null=True)
     last_name = models.CharField(max_length=100, blank=False, null=False)
@@ -23,6 +24,28 @@ class Patient(models.Model):
     profile_pic = models.ImageField(null=True, blank=True, upload_to='profile_pictures/')
     health_facility = models.ForeignKey("HealthFacility", on_delete=models.SET_NULL, null=True, blank=True)
     email = models.EmailField(null=True, blank=False)
+    # matching keys for duplicate detection, see main/matching.py
+    phone_key = models.CharField(max_length=13, blank=True, default='', editable=False, db_index=True)
+    name_key = models.CharField(max_length=255, blank=True, default='', editable=False, db_index=True)
+    phonetic_key = models.CharField(max_length=50, blank=True, default='', editable=False, db_index=True)
+
+    MATCHING_FIELDS = {'first_name', 'last_name', 'phone_number'}
+
+    class Meta:
+        indexes = [
+            # the patients table sorts on the names, with the id as tie-breaker
+            models.Index(fields=['first_name', 'id']),
+            models.Index(fields=['last_name', 'id']),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.phone_key = normalize_phone(self.phone_number)
+        self.name_key = name_key(self.first_name, self.last_name)
+        self.phonetic_key = phonetic_key(self.first_name, self.last_name)[:50]
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and self.MATCHING_FIELDS.intersection(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'phone_key', 'name_key', 'phonetic_key'}
+        super().save(*args, **kwargs)
 
     def get_all_visits(self):
         return self.visits.all()
@@ -50,7 +73,7 @@ class Visit(models.Model):
     patient = models.ForeignKey(Patient, related_name='visits', on_delete=models.CASCADE, null=True, blank=True)
     community_work = models.ForeignKey("CommunityWork", on_delete=models.SET_NULL, null=True)
     health_facility = models.ForeignKey("HealthFacility", on_delete=models.SET_NULL, null=True)
-    date = models.DateTimeField(auto_now_add=True)
+    date = models.DateTimeField(auto_now_add=True, db_index=True)
     disease = models.CharField(max_length=255)
     weight = models.DecimalField(max_digits=5, decimal_places=2)
     bmi = models.DecimalField(max_digits=5, decimal_places=2)
@@ -58,6 +81,8 @@ class Visit(models.Model):
     is_transferred = models.BooleanField(default=False) 
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active')  
 
+    # Visit.objects.in_location(district_id, field='patient__location_path')
+    objects = LocatedQuerySet.as_manager()
 
     def __str__(self):
         return f"Visit on {self.date} for {self.patient.first_name}"
@@ -67,9 +92,11 @@ class Transfer(models.Model):
     visit = models.ForeignKey(Visit, related_name="transfers", on_delete=models.CASCADE)
     from_health_facility = models.ForeignKey("HealthFacility", on_delete=models.CASCADE, related_name="outgoing_transfers")
     to_hospital = models.ForeignKey("HealthFacility", on_delete=models.CASCADE, related_name="incoming_transfers")
-    transfer_date = models.DateTimeField(auto_now_add=True)
+    transfer_date = models.DateTimeField(auto_now_add=True, db_index=True)
     patient_arrived_at = models.DateTimeField(null=True, blank=True) 
-    delay_in_hours = models.PositiveIntegerField(null=True, blank=True)
+    delay_in_hours = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    # not arrived TRANSFER_OVERDUE_HOURS after the transfer, set by manage.py detect_overdue
+    overdue = models.BooleanField(default=False, db_index=True)
 
     def __str__(self):
         return f"Transfer of {self.visit.patient} to {self.to_hospital.name}"
@@ -86,8 +113,9 @@ class Transfer(models.Model):
                 if timezone.is_aware(self.transfer_date):
                     self.transfer_date = timezone.make_naive(self.transfer_date)
             
-            delay = (self.patient_arrived_at - self.transfer_date).total_seconds() / 3600
-            self.delay_in_hours = round(delay, 2)
+            # whole hours, as HoursBetween computes them for manage.py detect_overdue
+            seconds = round((self.patient_arrived_at - self.transfer_date).total_seconds())
+            self.delay_in_hours = seconds // 3600 if seconds >= 0 else None
             self.save()
     
 
@@ -97,6 +125,14 @@ class Appointment(models.Model):
     appointment_date = models.DateField()
     appointment_time = models.TimeField()
     arrived_at = models.DateField(null=True, blank=True)
+    reminder_sent_at = models.DateTimeField(null=True, blank=True)
+    # the day passed without arrival, set by manage.py detect_overdue
+    missed = models.BooleanField(default=False, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['appointment_date', 'appointment_time']),
+        ]
 
     def __str__(self):
         return f"{self.appointment_date} at {self.appointment_time} for {self.patient}"
@@ -106,7 +142,7 @@ HEALTH_FACILITY_STATUS = (
     ('hospital', 'hospital'),
 ) 
 
-class HealthFacility(models.Model):
+class HealthFacility(LocationPathMixin):
     name = models.CharField(max_length=255, null=False, blank=False)
     district = models.ForeignKey(District, on_delete=models.CASCADE, null=True, blank=False)
     sector = models.ForeignKey(Sector, on_delete=models.CASCADE, null=True, blank=False)
@@ -118,13 +154,21 @@ class HealthFacility(models.Model):
     status = models.CharField(max_length=25, choices=HEALTH_FACILITY_STATUS, null=False, blank=False)
     profile_pic = models.ImageField(null=True, blank=True, upload_to='profile_pictures/')
     email = models.EmailField(null=True, blank=False)
+    # lowercase name for autocomplete prefix lookups
+    name_key = models.CharField(max_length=255, blank=True, default='', editable=False, db_index=True)
 
+    def save(self, *args, **kwargs):
+        self.name_key = search_key(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'name_key'}
+        super().save(*args, **kwargs)
 
     def __str__(self) -> str:
         return self.name
     
 
-class Doctor(models.Model):
+class Doctor(LocationPathMixin):
     first_name = models.CharField(max_length=255, null=False, blank=False)
     middle_name = models.CharField(max_length=255, null=True, blank=True)
     last_name = models.CharField(max_length=255, null=False, blank=False)
@@ -142,7 +186,7 @@ class Doctor(models.Model):
         return self.first_name
     
 
-class CommunityWork(models.Model):
+class CommunityWork(LocationPathMixin):
     first_name = models.CharField(max_length=255, null=False, blank=False)
     middle_name = models.CharField(max_length=255, null=True, blank=True)
     last_name = models.CharField(max_length=255, null=False, blank=False)
@@ -155,8 +199,19 @@ class CommunityWork(models.Model):
     phone_number = models.CharField(validators=[phone_regex], max_length=13, blank=True)
     profile_pic = models.ImageField(null=True, blank=True, upload_to='profile_pictures/')
     email = models.EmailField(null=True, blank=False)
+    # lowercase "first last" and "last first" for autocomplete prefix lookups
+    name_key = models.CharField(max_length=255, blank=True, default='', editable=False, db_index=True)
+    surname_key = models.CharField(max_length=255, blank=True, default='', editable=False, db_index=True)
 
+    NAME_FIELDS = {'first_name', 'last_name'}
 
+    def save(self, *args, **kwargs):
+        self.name_key = search_key(self.first_name, self.last_name)
+        self.surname_key = search_key(self.last_name, self.first_name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and self.NAME_FIELDS.intersection(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'name_key', 'surname_key'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.first_name
@@ -175,4 +230,116 @@ class User(AbstractUser):
     chw_assigned = models.ForeignKey(CommunityWork ,on_delete=models.SET_NULL, blank=True, null=True)
     health_facility_assigned = models.ForeignKey(HealthFacility, on_delete=models.SET_NULL, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True, blank=True, null=True)
-    first_login = models.BooleanField(default=True, blank=True, null=True)
\ No newline at end of file
+    first_login = models.BooleanField(default=True, blank=True, null=True)
+
+class DashboardCounter(models.Model):
+    """Precomputed dashboard figure for one scope (national, one CHW or one facility)"""
+    NATIONAL = 'national'
+    CHW = 'chw'
+    FACILITY = 'facility'
+    SCOPE_CHOICES = [
+        (NATIONAL, 'National'),
+        (CHW, 'Community Health Worker'),
+        (FACILITY, 'Health Facility'),
+    ]
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    scope_id = models.PositiveBigIntegerField(default=0)
+    key = models.CharField(max_length=50)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'scope_id', 'key'], name='unique_dashboard_counter'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}:{self.scope_id} {self.key} = {self.value}"
+
+
+class VisitRollup(models.Model):
+    """Number of visits per day and dimension combination; 0 stands for "none" in the id columns"""
+    day = models.DateField()
+    health_facility_id = models.PositiveBigIntegerField(default=0)
+    community_work_id = models.PositiveBigIntegerField(default=0)
+    district_id = models.PositiveBigIntegerField(default=0)
+    diagnize_classification = models.CharField(max_length=10)
+    status = models.CharField(max_length=10)
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'health_facility_id', 'community_work_id', 'district_id', 'diagnize_classification', 'status'],
+                name='unique_visit_rollup',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['health_facility_id', 'day']),
+            models.Index(fields=['community_work_id', 'day']),
+        ]
+
+    def __str__(self):
+        return f"{self.day}: {self.count} visits"
+
+
+class PatientAccess(models.Model):
+    """
+    A patient a CHW or facility may see: registered at the facility, visited
+    by the CHW or at the facility, or transferred from or to the facility.
+    Role-scoped patient lists filter on it with one indexed semi-join.
+    """
+    CHW = 'chw'
+    FACILITY = 'facility'
+    SCOPE_CHOICES = [
+        (CHW, 'Community Health Worker'),
+        (FACILITY, 'Health Facility'),
+    ]
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    scope_id = models.PositiveBigIntegerField()
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='access')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'scope_id', 'patient'], name='unique_patient_access'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}:{self.scope_id} patient {self.patient_id}"
+
+
+class Notification(models.Model):
+    """Outbox of SMS and emails, delivered by the send_notifications worker"""
+    SMS = 'sms'
+    EMAIL = 'email'
+    CHANNEL_CHOICES = [
+        (SMS, 'SMS'),
+        (EMAIL, 'Email'),
+    ]
+    PENDING = 'pending'
+    SENT = 'sent'
+    DEAD = 'dead'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (DEAD, 'Dead'),
+    ]
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES)
+    recipient = models.CharField(max_length=255)
+    subject = models.CharField(max_length=255, blank=True)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    # set for notifications that must be queued at most once, e.g. "appointment:12:patient"
+    dedupe_key = models.CharField(max_length=100, unique=True, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.channel} to {self.recipient} ({self.status})"
@@ -0,0 +1,55 @@
+import re
+import unicodedata
+
+SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'), **dict.fromkeys('cgjkqsxz', '2'), **dict.fromkeys('dt', '3'),
+    'l': '4', **dict.fromkeys('mn', '5'), 'r': '6',
+}
+
+
+def normalize_phone(phone_number):
+    """The last 9 digits, so '+250 783 378 349', '0783378349' and '783378349' all match"""
+    digits = re.sub(r'\D', '', phone_number or '')
+    return digits[-9:]
+
+
+def ascii_lower(*names):
+    text = unicodedata.normalize('NFKD', ' '.join(name or '' for name in names))
+    return text.encode('ascii', 'ignore').decode().lower()
+
+
+def name_tokens(*names):
+    """Lowercase ASCII words of the names, sorted so that swapped first/last names match"""
+    return sorted(re.findall(r'[a-z]+', ascii_lower(*names)))
+
+
+def search_key(*names):
+    """'Marié  UWASE' -> 'marie uwase', for indexed prefix (range) lookups"""
+    return ' '.join(re.findall(r'[a-z0-9]+', ascii_lower(*names)))
+
+
+def prefix_range(field, prefix):
+    """Lookups matching values of ``field`` that start with ``prefix``, as a range the index can serve"""
+    return {f'{field}__gte': prefix, f'{field}__lt': prefix + '\uffff'}
+
+
+def soundex(word):
+    if not word:
+        return ''
+    code = word[0].upper()
+    previous = SOUNDEX_CODES.get(word[0], '')
+    for letter in word[1:]:
+        digit = SOUNDEX_CODES.get(letter, '')
+        if digit and digit != previous:
+            code += digit
+        if letter not in 'hw':
+            previous = digit
+    return (code + '000')[:4]
+
+
+def name_key(first_name, last_name):
+    return ' '.join(name_tokens(first_name, last_name))
+
+
+def phonetic_key(first_name, last_name):
+    return ' '.join(sorted(soundex(token) for token in name_tokens(first_name, last_name)))
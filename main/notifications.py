@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Notification
+from .send_mail import SUBJECT, anc_send_email
+from .send_sms import get_backend, send_sms
+
+logger = logging.getLogger(__name__)
+
+# how long a claimed notification is hidden from other workers while it is being sent
+LEASE = timedelta(minutes=5)
+
+
+def queue_sms(phone_number, message):
+    if phone_number:
+        return Notification.objects.create(channel=Notification.SMS, recipient=phone_number, body=message)
+
+
+def queue_email(email, message, subject=SUBJECT):
+    if email:
+        return Notification.objects.create(channel=Notification.EMAIL, recipient=email, subject=subject, body=message)
+
+
+def queue_many(notifications):
+    """
+    Bulk insert unsaved Notification objects. Those whose dedupe_key is
+    already in the outbox are skipped, so queueing the same batch twice is
+    harmless.
+    """
+    Notification.objects.bulk_create(notifications, batch_size=1000, ignore_conflicts=True)
+
+
+def backoff(attempts):
+    """Exponential delay before the next attempt, capped at NOTIFICATION_MAX_BACKOFF seconds"""
+    seconds = settings.NOTIFICATION_BACKOFF * 2 ** (attempts - 1)
+    return timedelta(seconds=min(seconds, settings.NOTIFICATION_MAX_BACKOFF))
+
+
+def claim(limit):
+    """
+    Lease up to ``limit`` due notifications to this worker. Rows are locked
+    with SKIP LOCKED where the database supports it so that several workers
+    can run side by side.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        due = Notification.objects.filter(status=Notification.PENDING, next_attempt_at__lte=now).order_by('next_attempt_at')
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        notifications = list(due[:limit])
+        Notification.objects.filter(pk__in=[n.pk for n in notifications]).update(next_attempt_at=now + LEASE)
+    return notifications
+
+
+class Mailer:
+    """Opens the SMTP connection on the first email and keeps it for the whole batch"""
+
+    def __init__(self):
+        self.connection = None
+
+    def send(self, email, message, subject):
+        if self.connection is None:
+            connection = get_connection()
+            connection.open()
+            self.connection = connection
+        anc_send_email(email, message, connection=self.connection, subject=subject or SUBJECT)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart; a rate of 0 means no limit"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = 0
+
+    def reserve(self):
+        """Take the next free slot; returns how long to wait for it"""
+        now = time.monotonic()
+        delay = max(0, self.next_at - now)
+        self.next_at = now + delay + self.interval
+        return delay
+
+    def wait(self):
+        time.sleep(self.reserve())
+
+    async def await_turn(self):
+        await asyncio.sleep(self.reserve())
+
+
+_sms_limiter = None
+
+
+def sms_limiter():
+    global _sms_limiter
+    if _sms_limiter is None:
+        _sms_limiter = RateLimiter(settings.SMS_RATE_LIMIT)
+    return _sms_limiter
+
+
+def deliver(notification, mailer):
+    if notification.channel == Notification.SMS:
+        sms_limiter().wait()
+        send_sms(notification.recipient, notification.body)
+    else:
+        mailer.send(notification.recipient, notification.body, notification.subject)
+
+
+def _batch_size(limit):
+    if settings.SMS_RATE_LIMIT:
+        # don't claim more than can be sent before the lease runs out
+        limit = max(1, min(limit, int(LEASE.total_seconds() * settings.SMS_RATE_LIMIT / 2)))
+    return limit
+
+
+def process(limit=100):
+    """Send one batch of due notifications one after the other; returns (sent, failed)"""
+    sent = failed = 0
+    mailer = Mailer()
+    try:
+        for notification in claim(_batch_size(limit)):
+            try:
+                deliver(notification, mailer)
+            except Exception as e:
+                error = e
+            else:
+                error = None
+            if record(notification, error):
+                sent += 1
+            else:
+                failed += 1
+    finally:
+        mailer.close()
+    return sent, failed
+
+
+def process_concurrently(limit=100, concurrency=10):
+    """
+    Like process() but with up to ``concurrency`` SMS in flight at once
+    through the backend's asend(). Emails go over one SMTP connection in a
+    thread next to them. SMS_RATE_LIMIT still applies.
+    """
+    notifications = claim(_batch_size(limit))
+    errors = asyncio.run(_deliver_all(notifications, concurrency))
+    sent = sum(record(notification, error) for notification, error in zip(notifications, errors))
+    return sent, len(notifications) - sent
+
+
+async def _deliver_all(notifications, concurrency):
+    """The delivery error of each notification, None for those that were sent"""
+    backend = get_backend()
+    semaphore = asyncio.Semaphore(concurrency)
+    errors = {}
+
+    async def send_one(notification):
+        async with semaphore:
+            await sms_limiter().await_turn()
+            try:
+                await backend.asend(notification.recipient, notification.body)
+            except Exception as e:
+                errors[notification.pk] = e
+
+    def send_emails(emails):
+        mailer = Mailer()
+        try:
+            for notification in emails:
+                try:
+                    mailer.send(notification.recipient, notification.body, notification.subject)
+                except Exception as e:
+                    errors[notification.pk] = e
+        finally:
+            mailer.close()
+
+    emails = [n for n in notifications if n.channel == Notification.EMAIL]
+    sms = [n for n in notifications if n.channel == Notification.SMS]
+    try:
+        await asyncio.gather(asyncio.to_thread(send_emails, emails), *(send_one(n) for n in sms))
+    finally:
+        await backend.aclose()
+    return [errors.get(notification.pk) for notification in notifications]
+
+
+def record(notification, error):
+    """Save the outcome of a delivery attempt; returns True when it was sent"""
+    notification.attempts += 1
+    if error is not None:
+        notification.last_error = f"{type(error).__name__}: {error}"
+        if notification.attempts >= settings.NOTIFICATION_MAX_ATTEMPTS:
+            notification.status = Notification.DEAD
+            logger.error("Giving up on notification %s after %s attempts: %s", notification.pk, notification.attempts, error)
+        else:
+            notification.next_attempt_at = timezone.now() + backoff(notification.attempts)
+            logger.warning("Notification %s failed, retrying at %s: %s", notification.pk, notification.next_attempt_at, error)
+    else:
+        notification.status = Notification.SENT
+        notification.sent_at = timezone.now()
+    notification.save(update_fields=['attempts', 'status', 'next_attempt_at', 'last_error', 'sent_at'])
+    return notification.status == Notification.SENT
@@ -0,0 +1,65 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import NotSupportedError, models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Appointment, Transfer
+
+
+class HoursBetween(models.Func):
+    """Whole hours from ``start`` to ``end`` (two datetime expressions), computed in SQL"""
+    output_field = models.IntegerField()
+    arity = 2
+    templates = {
+        # julianday() counts days; rounding to seconds first avoids 1.9999 hours
+        'sqlite': 'CAST(ROUND((julianday({end}) - julianday({start})) * 86400) / 3600 AS INTEGER)',
+        'postgresql': 'FLOOR(EXTRACT(EPOCH FROM ({end} - {start})) / 3600)::integer',
+        'mysql': 'TIMESTAMPDIFF(HOUR, {start}, {end})',
+    }
+
+    def as_sql(self, compiler, connection, **extra_context):
+        template = self.templates.get(connection.vendor)
+        if template is None:
+            raise NotSupportedError(f'HoursBetween is not implemented for {connection.vendor}')
+        (start, start_params), (end, end_params) = (compiler.compile(e) for e in self.get_source_expressions())
+        params = (*start_params, *end_params) if template.index('{start}') < template.index('{end}') else (*end_params, *start_params)
+        return template.format(start=start, end=end), params
+
+
+def transfer_delays():
+    """Fill delay_in_hours of arrived transfers that don't have it yet"""
+    return (
+        Transfer.objects
+        .filter(patient_arrived_at__isnull=False, delay_in_hours__isnull=True, patient_arrived_at__gte=F('transfer_date'))
+        .update(delay_in_hours=HoursBetween('transfer_date', 'patient_arrived_at'))
+    )
+
+
+def overdue_transfers(now):
+    cutoff = now - timedelta(hours=settings.TRANSFER_OVERDUE_HOURS)
+    flagged = Transfer.objects.filter(overdue=False, patient_arrived_at__isnull=True, transfer_date__lt=cutoff).update(overdue=True)
+    cleared = Transfer.objects.filter(overdue=True, patient_arrived_at__isnull=False).update(overdue=False)
+    return flagged, cleared
+
+
+def missed_appointments(today):
+    flagged = Appointment.objects.filter(missed=False, arrived_at__isnull=True, appointment_date__lt=today).update(missed=True)
+    cleared = Appointment.objects.filter(missed=True, arrived_at__isnull=False).update(missed=False)
+    return flagged, cleared
+
+
+@transaction.atomic
+def detect(now=None):
+    """One pass over the whole country: a handful of UPDATEs, no per-row saves"""
+    now = now or timezone.now()
+    transfers_flagged, transfers_cleared = overdue_transfers(now)
+    appointments_flagged, appointments_cleared = missed_appointments(timezone.localdate(now))
+    return {
+        'delays': transfer_delays(),
+        'overdue_transfers': transfers_flagged,
+        'arrived_transfers': transfers_cleared,
+        'missed_appointments': appointments_flagged,
+        'attended_appointments': appointments_cleared,
+    }
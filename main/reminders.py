@@ -0,0 +1,116 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Appointment, Notification
+from .notifications import queue_many
+
+
+def due_appointments(start, end):
+    """Appointments in [start, end) that nobody was reminded of yet, on the (date, time) index"""
+    start, end = timezone.localtime(start), timezone.localtime(end)
+    if start.date() == end.date():
+        window = Q(appointment_date=start.date(), appointment_time__gte=start.time(), appointment_time__lt=end.time())
+    else:
+        window = (
+            Q(appointment_date=start.date(), appointment_time__gte=start.time())
+            | Q(appointment_date__gt=start.date(), appointment_date__lt=end.date())
+            | Q(appointment_date=end.date(), appointment_time__lt=end.time())
+        )
+    return (
+        Appointment.objects
+        .filter(appointment_date__range=(start.date(), end.date()))
+        .filter(window, arrived_at__isnull=True, reminder_sent_at__isnull=True)
+        .select_related('patient__patient', 'patient__health_facility', 'patient__community_work')
+        .order_by('appointment_date', 'appointment_time', 'id')
+    )
+
+
+def patient_reminder(appointment):
+    visit = appointment.patient
+    place = f" at {visit.health_facility.name}" if visit.health_facility else ""
+    return Notification(
+        channel=Notification.SMS,
+        recipient=visit.patient.phone_number,
+        body=f"Dear {visit.patient.first_name}, you have an ANC appointment{place} on "
+             f"{appointment.appointment_date:%d/%m/%Y} at {appointment.appointment_time:%H:%M}.",
+        dedupe_key=f"appointment:{appointment.pk}:patient",
+    )
+
+
+def digest(email, lines, dedupe_key):
+    return Notification(
+        channel=Notification.EMAIL,
+        recipient=email,
+        subject="ANC Track: upcoming appointments",
+        body=f"{len(lines)} upcoming appointment(s):\n\n" + "\n".join(lines),
+        dedupe_key=dedupe_key,
+    )
+
+
+def send_reminders(start=None, hours=None, chunk_size=2000, dry_run=False):
+    """
+    Queue an SMS for every patient with an appointment in the next ``hours``
+    and one digest email per health facility and per CHW. Reminded
+    appointments get ``reminder_sent_at`` and every notification has a
+    dedupe key, so running this again never sends anything twice.
+
+    The due appointments are read in chunks of ids (keyset on the id) before
+    any of them is stamped. The stamps and every notification, the digests
+    included, are written in one transaction: either the whole run is
+    queued or it can be run again.
+    """
+    start = start or timezone.now()
+    end = start + timedelta(hours=hours or settings.REMINDER_WINDOW_HOURS)
+    stats = {'appointments': 0, 'sms': 0, 'no_phone': 0, 'digests': 0}
+    by_facility = defaultdict(list)
+    by_chw = defaultdict(list)
+    contacts = {}
+    due = due_appointments(start, end)
+
+    with transaction.atomic():
+        last = 0
+        while True:
+            ids = list(due.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+            if not ids:
+                break
+            last = ids[-1]
+            chunk = list(due.filter(pk__in=ids))
+            notifications = []
+            for appointment in chunk:
+                visit = appointment.patient
+                if visit.patient.phone_number:
+                    notifications.append(patient_reminder(appointment))
+                else:
+                    stats['no_phone'] += 1
+                line = (
+                    (appointment.appointment_date, appointment.appointment_time),
+                    f"{appointment.appointment_date:%d/%m/%Y} {appointment.appointment_time:%H:%M}  "
+                    f"{visit.patient.first_name} {visit.patient.last_name}",
+                )
+                if visit.health_facility and visit.health_facility.email:
+                    by_facility[visit.health_facility_id].append(line)
+                    contacts['facility', visit.health_facility_id] = visit.health_facility.email
+                if visit.community_work and visit.community_work.email:
+                    by_chw[visit.community_work_id].append(line)
+                    contacts['chw', visit.community_work_id] = visit.community_work.email
+            stats['appointments'] += len(chunk)
+            stats['sms'] += len(notifications)
+            if not dry_run:
+                queue_many(notifications)
+                Appointment.objects.filter(pk__in=ids).update(reminder_sent_at=timezone.now())
+
+        run = f"{timezone.localtime(start):%Y%m%d%H}"
+        digests = [
+            digest(contacts[kind, pk], [text for _, text in sorted(lines)], f"reminders:{run}:{kind}:{pk}")
+            for kind, groups in (('facility', by_facility), ('chw', by_chw))
+            for pk, lines in groups.items()
+        ]
+        stats['digests'] = len(digests)
+        if not dry_run:
+            queue_many(digests)
+    return stats
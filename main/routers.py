@@ -0,0 +1,74 @@
+"""
+Routing of reads to the replicas of settings.REPLICA_DATABASES. Only code
+that opts in reads from them: ReplicaReadMixin on the dashboards, lists and
+analytics, or the use_replicas() context manager. Everything else, and every
+write, goes to the primary.
+
+Once a request writes, its remaining reads go to the primary too, and
+ReplicaPinMiddleware keeps the client's next requests there for
+REPLICA_PIN_SECONDS so it reads its own writes despite replication lag.
+"""
+import random
+from contextlib import contextmanager
+
+from asgiref.local import Local
+from django.conf import settings
+
+PIN_COOKIE = 'primary_db'
+# sessions must see the login that just happened, the cache table (the shared
+# cache's version keys) must see the latest bump
+PRIMARY_APPS = {'sessions', 'django_cache'}
+
+_state = Local()
+
+
+@contextmanager
+def use_replicas():
+    """Send the reads of the block to one replica (the same for the whole block)"""
+    previous = getattr(_state, 'replica', None)
+    _state.replica = random.choice(settings.REPLICA_DATABASES) if settings.REPLICA_DATABASES else None
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def pinned():
+    return getattr(_state, 'pinned', False)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if pinned() or model._meta.app_label in PRIMARY_APPS:
+            return None
+        return getattr(_state, 'replica', None)
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label not in PRIMARY_APPS:
+            _state.pinned = _state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get the schema from the primary through replication
+        return db == 'default'
+
+
+class ReplicaPinMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.pinned, _state.wrote = PIN_COOKIE in request.COOKIES, False
+        try:
+            response = self.get_response(request)
+            if _state.wrote and settings.REPLICA_DATABASES:
+                response.set_cookie(
+                    PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+                )
+        finally:
+            _state.pinned = _state.wrote = False
+        return response
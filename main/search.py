@@ -0,0 +1,114 @@
+import re
+
+from django.conf import settings
+from django.db import connection, connections, router
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Patient, PatientAccess
+from .normalize import normalize_phone
+
+_backend = None
+
+
+def terms(query):
+    """Words and numbers of a search box query, lowercased"""
+    return re.findall(r'\w+', query.lower())
+
+
+class SQLiteFTSBackend:
+    """
+    An FTS5 inverted index (table patient_search, created by migration 0018)
+    whose rowid is the patient id. The facility column holds the registration
+    facility as a token such as "f12"; role-scoped searches semi-join the
+    matches with PatientAccess.
+    """
+    table = 'patient_search'
+
+    def document(self, patient):
+        village = patient.village.name if patient.village_id else ''
+        phone = f'{patient.phone_number} {normalize_phone(patient.phone_number)}'
+        facility = f'f{patient.health_facility_id}' if patient.health_facility_id else ''
+        return (
+            patient.pk, ' '.join(filter(None, (patient.first_name, patient.middle_name, patient.last_name))),
+            patient.identity or '', phone, village, facility,
+        )
+
+    def index(self, patient):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [patient.pk])
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, names, identity, phone, village, facility) VALUES (%s, %s, %s, %s, %s, %s)',
+                self.document(patient),
+            )
+
+    def remove(self, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [pk])
+
+    def search(self, query, membership=None, limit=20):
+        words = terms(query)
+        if not words:
+            return []
+        # every word is a prefix: "mar uwa" finds Mary Uwase
+        match = ' AND '.join(f'"{word}"*' for word in words)
+        where, params = f'{self.table} MATCH %s', [match]
+        if membership is not None:
+            where += f' AND rowid IN (SELECT patient_id FROM {PatientAccess._meta.db_table} WHERE scope = %s AND scope_id = %s)'
+            params.extend(membership)
+        with connections[router.db_for_read(Patient)].cursor() as cursor:
+            cursor.execute(f'SELECT rowid FROM {self.table} WHERE {where} ORDER BY rank LIMIT %s', [*params, limit])
+            return [pk for pk, in cursor.fetchall()]
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+        documents = [self.document(patient) for patient in Patient.objects.select_related('village').iterator(chunk_size=2000)]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, names, identity, phone, village, facility) VALUES (%s, %s, %s, %s, %s, %s)',
+                documents,
+            )
+        return len(documents)
+
+
+class DatabaseBackend:
+    """Index-free fallback for databases without FTS5: prefix matches on the patient columns"""
+
+    def index(self, patient):
+        pass
+
+    def remove(self, pk):
+        pass
+
+    def search(self, query, membership=None, limit=20):
+        queryset = Patient.objects.all()
+        if membership is not None:
+            scope, scope_id = membership
+            queryset = queryset.filter(pk__in=PatientAccess.objects.filter(scope=scope, scope_id=scope_id).values('patient'))
+        for word in terms(query):
+            queryset = queryset.filter(
+                Q(first_name__istartswith=word) | Q(middle_name__istartswith=word) | Q(last_name__istartswith=word)
+                | Q(identity__startswith=word) | Q(phone_number__contains=word) | Q(village__name__istartswith=word)
+            )
+        return list(queryset.order_by('last_name', 'first_name').values_list('pk', flat=True)[:limit])
+
+    def rebuild(self):
+        return 0
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(settings.PATIENT_SEARCH_BACKEND)()
+    return _backend
+
+
+def search_patients(queryset, query, membership=None, limit=20):
+    """
+    The patients of ``queryset`` (already role-scoped) matching ``query``,
+    best match first. ``membership`` lets the index apply the scope too.
+    """
+    ids = get_backend().search(query, membership=membership, limit=limit)
+    patients = {patient.pk: patient for patient in queryset.filter(pk__in=ids)}
+    return [patients[pk] for pk in ids if pk in patients]
@@ -1,15 +1,16 @@
 from django.core.mail import send_mail
 
+SUBJECT = "ANC Track Notification"
 
-def anc_send_email(email, message):
-    
+
+def anc_send_email(email, message, connection=None, subject=SUBJECT):
+    """Pass an open ``connection`` to send several emails over one SMTP session"""
     send_mail(
-        subject="ANC Track Notification", 
-        message=message, 
-        recipient_list=[email], 
-        from_email=None, 
-        fail_silently=False
+        subject=subject,
+        message=message,
+        recipient_list=[email],
+        from_email=None,
+        fail_silently=False,
+        connection=connection,
         )
 
-
-# EMAIL PASSWORD = zdia cpwp dvlz esvv
\ No newline at end of file
@@ -1,17 +1,67 @@
+from django.conf import settings
+from django.utils.module_loading import import_string
+from twilio.http.async_http_client import AsyncTwilioHttpClient
+from twilio.http.http_client import TwilioHttpClient
 from twilio.rest import Client
 from decouple import config
 
-def send_sms(phone_number, message):
+FROM_NUMBER = '+14158814070'
+
+# sent messages of the locmem backend, like django.core.mail.outbox
+outbox = []
+_backend = None
+
+
+class TwilioBackend:
+    """One Twilio client per process, its HTTP session keeps the connection to the API alive"""
+
+    def __init__(self):
+        self.account_sid = config("ACCOUNT_SID")
+        self.auth_token = config('AUTH_TOKEN')
+        self.client = Client(self.account_sid, self.auth_token, http_client=TwilioHttpClient(pool_connections=True))
+        self.async_client = None
+
+    def send(self, phone_number, message):
+        message = self.client.messages.create(
+            body=message,
+            from_=FROM_NUMBER,
+            to=phone_number
+            )
+        return message.sid
+
+    async def asend(self, phone_number, message):
+        # the aiohttp session has to be created inside the running event loop
+        if self.async_client is None:
+            self.async_client = Client(self.account_sid, self.auth_token, http_client=AsyncTwilioHttpClient())
+        message = await self.async_client.messages.create_async(body=message, from_=FROM_NUMBER, to=phone_number)
+        return message.sid
+
+    async def aclose(self):
+        if self.async_client is not None:
+            await self.async_client.http_client.close()
+            self.async_client = None
 
-    account_sid = config("ACCOUNT_SID")
-    auth_token = config('AUTH_TOKEN')
-    client = Client(account_sid, auth_token)
 
-    message = client.messages.create(
-        body=message,
-        from_='+14158814070',
-        to=phone_number #'+250783378349'
-        )
-    return message.sid
+class LocmemBackend:
+    """Keeps messages in ``outbox`` instead of sending them, for tests and development"""
 
-# print(send_sms('+250783378349'))
\ No newline at end of file
+    def send(self, phone_number, message):
+        outbox.append((phone_number, message))
+        return f'locmem-{len(outbox)}'
+
+    async def asend(self, phone_number, message):
+        return self.send(phone_number, message)
+
+    async def aclose(self):
+        pass
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(settings.SMS_BACKEND)()
+    return _backend
+
+
+def send_sms(phone_number, message):
+    return get_backend().send(phone_number, message)
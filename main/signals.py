@@ -0,0 +1,114 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from . import access, analytics, dashboard, membership, search
+from .models import CommunityWork, HealthFacility, Patient, PatientAccess, Transfer, Visit
+
+
+@receiver(pre_save, sender=Visit)
+def remember_visit_counters(sender, instance, raw=False, **kwargs):
+    instance._dashboard_counters = instance._rollup_key = None
+    if instance.pk and not raw:
+        previous = Visit.objects.select_related('patient').filter(pk=instance.pk).first()
+        if previous is not None:
+            instance._dashboard_counters = dashboard.visit_counters(previous)
+            instance._rollup_key = analytics.rollup_key(previous, analytics.visit_district(previous))
+
+
+@receiver(post_save, sender=Visit)
+def update_visit_counters(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    deltas = dashboard.visit_counters(instance)
+    deltas.subtract(getattr(instance, '_dashboard_counters', None) or {})
+    dashboard.apply(deltas)
+
+    rollups = Counter({analytics.rollup_key(instance, analytics.visit_district(instance)): 1})
+    previous = getattr(instance, '_rollup_key', None)
+    if previous is not None:
+        rollups[previous] -= 1
+    analytics.apply(rollups)
+
+
+@receiver(post_delete, sender=Visit)
+def remove_visit_counters(sender, instance, **kwargs):
+    deltas = dashboard.visit_counters(instance)
+    dashboard.apply({counter: -n for counter, n in deltas.items()})
+    analytics.apply({analytics.rollup_key(instance, analytics.visit_district(instance)): -1})
+
+
+@receiver(post_save, sender=Transfer)
+@receiver(post_delete, sender=Transfer)
+def invalidate_transfer_stats(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(analytics.invalidate_transfer_stats)
+
+
+@receiver(post_save, sender=Transfer)
+def add_transfer_counters(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        dashboard.apply(dashboard.transfer_counters(instance, instance.visit.community_work_id))
+
+
+@receiver(post_delete, sender=Transfer)
+def remove_transfer_counters(sender, instance, **kwargs):
+    community_work_id = Visit.objects.filter(pk=instance.visit_id).values_list('community_work_id', flat=True).first()
+    deltas = dashboard.transfer_counters(instance, community_work_id)
+    dashboard.apply({counter: -n for counter, n in deltas.items()})
+
+
+@receiver(post_save, sender=Patient)
+def index_patient(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.get_backend().index(instance)
+
+
+@receiver(post_delete, sender=Patient)
+def unindex_patient(sender, instance, **kwargs):
+    search.get_backend().remove(instance.pk)
+
+
+@receiver(post_save, sender=Patient)
+def grant_patient_access(sender, instance, raw=False, **kwargs):
+    if not raw:
+        membership.grant(membership.patient_pairs(instance))
+
+
+@receiver(post_save, sender=Visit)
+def grant_visit_access(sender, instance, raw=False, **kwargs):
+    if not raw:
+        membership.grant(membership.visit_pairs(instance))
+
+
+@receiver(post_save, sender=Transfer)
+def grant_transfer_access(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        membership.grant(membership.transfer_pairs(instance, instance.visit.patient_id))
+
+
+@receiver(post_save, sender=CommunityWork)
+@receiver(post_delete, sender=CommunityWork)
+def invalidate_community_work_scopes(sender, instance, raw=False, **kwargs):
+    # users' own changes are seen by get_scope, only the names shown need a bump
+    if not raw:
+        transaction.on_commit(lambda: access.invalidate(PatientAccess.CHW, instance.pk))
+
+
+@receiver(post_save, sender=HealthFacility)
+@receiver(post_delete, sender=HealthFacility)
+def invalidate_health_facility_scopes(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: access.invalidate(PatientAccess.FACILITY, instance.pk))
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            for name, value in settings.SQLITE_PRAGMAS.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
@@ -16,10 +16,15 @@ urlpatterns = [
     path('doctor-detail/<int:pk>/', views.DoctorDetailView.as_view(), name='doctor-detail'),
     path('patient-detail/<int:pk>/', views.PatientDetail.as_view(), name='patient-detail'),
     path('patients/', views.PatientView.as_view(), name='patients'),
+    path('patients/search/', views.PatientSearchView.as_view(), name='patient-search'),
     path('health-facility-detail/<int:pk>/', views.HealthFacilityDetailView.as_view(), name='health-facility-detail'),
     path('health-facilities/', views.HealthFacilityView.as_view(), name='health-facilities'),
     path('transfers/', views.TransferView.as_view(), name='transfers'),
     path('transfer-patient/<int:id>/', views.transfer_patient, name='transfer-patient'),
+    path('analytics/visits/', views.VisitAnalyticsView.as_view(), name='visit-analytics'),
+    path('analytics/transfers/', views.TransferAnalyticsView.as_view(), name='transfer-analytics'),
+    path('autocomplete/<str:source>/', views.AutocompleteView.as_view(), name='autocomplete'),
+    path('visits/batch/', views.VisitBatchView.as_view(), name='visit-batch'),
     path('current-visits/', views.CurrentVisit.as_view(), name='current-visits'),
     path('current-visit-detail/<int:pk>/', views.CurrentVisitDetail.as_view(), name='current-visit-detail'),
     path('signup/', views.SignUpView.as_view(), name='signup'),
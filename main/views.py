@@ -4,7 +4,8 @@ from django.http.response import HttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
 from django.contrib import messages
-from django.http import HttpResponseRedirect, Http404
+from django.http import HttpResponseRedirect, Http404, JsonResponse
+from django.db.models import Q
 from django.views.generic.base import TemplateView, View
 from django.views.generic.edit import CreateView, UpdateView
 from django.views.generic.list import ListView
@@ -16,14 +17,28 @@ from django.contrib.auth.views import PasswordChangeView
 from django.urls import reverse_lazy
 from django.contrib.messages.views import SuccessMessageMixin
 from django.contrib.auth.views import LoginView
-from .forms import PatientForm, DoctorForm, CommunityWorkForm, HealthFacilityForm, CustomUserCreationForm, VisitForm, AppointmentFormSet
-from .models import Patient, HealthFacility, Visit, Transfer, CommunityWork, Appointment, Doctor, User
+from .forms import PatientForm, DoctorForm, CommunityWorkForm, HealthFacilityForm, CustomUserCreationForm, VisitForm, AppointmentFormSet, VisitBatchFormSet
+from .models import Patient, HealthFacility, Visit, Transfer, CommunityWork, Appointment, Doctor, User, DashboardCounter
 from django.contrib.auth import login, logout
-from location.models import District, Sector, Cell, Village
+from location.tree import get_tree
+from django.utils.cache import get_conditional_response
 from django.utils import timezone
-from.send_sms import send_sms
-from .send_mail import anc_send_email
-from .chart_data import chart_data
+from .notifications import queue_sms, queue_email
+from .dashboard import dashboard
+from . import analytics, matching
+from .autocomplete import SOURCES as AUTOCOMPLETE_SOURCES
+from .search import get_backend as search_backend, search_patients
+from .visits import create_visits
+from .pagination import encode_cursor, decode_cursor, cursor_values, keyset_filter, estimated_count, CursorPaginator
+from .routers import use_replicas
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections, transaction
+import datetime
+import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 class RoleRequiredMixin(LoginRequiredMixin, View):
     allowed_roles = []  # Set allowed roles in the view class
@@ -31,13 +46,13 @@ class RoleRequiredMixin(LoginRequiredMixin, View):
     def dispatch(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             return self.handle_no_auth()
-        if request.user.first_login and request.user.role:
+        if request.user.first_login and request.scope.role:
             return self.handle_first_login()
         # Ensure the user has a role before checking it
         # if not hasattr(request.user, 'role') or request.user.role not in self.allowed_roles:
         #     return self.handle_no_permission()
         # return super().dispatch(request, *args, **kwargs)
-        if request.user.is_superuser or request.user.role in self.allowed_roles:
+        if request.scope.is_superuser or request.scope.role in self.allowed_roles:
             return super().dispatch(request, *args, **kwargs)
         else:
             return self.handle_no_permission()
@@ -52,52 +67,198 @@ class RoleRequiredMixin(LoginRequiredMixin, View):
     def handle_first_login(self):
         return redirect('change_password')
 
-class RoleBasedQuerysetMixin:
-    """Mixin to filter objects based on the user's role"""
-    
+class ReplicaReadMixin:
+    """
+    GET requests of the view read from a replica (see main.routers). The
+    response is rendered inside, so the template's queries go there too.
+    The user and the access scope are loaded before, from the primary: a
+    replica may not have the user's latest role or assignment yet.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        if request.user.is_authenticated:
+            request.scope.role  # resolve the lazy scope now
+        with use_replicas():
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryBudgetMixin:
+    """
+    List views declare the related objects their template touches and the
+    number of queries one rendered page may run (the session, the user and the
+    page; the CHW/facility assignment comes from ``request.scope``). With QUERY_BUDGET_CHECK set
+    to "warn" or "raise" the queries of every request are counted and an
+    overrun is logged or raised, so an N+1 regression shows up right away.
+    """
+    select_related = ()
+    prefetch_related = ()
+    query_budget = None
+
     def get_queryset(self):
-        # Get the base queryset from the model defined in the view
         queryset = super().get_queryset()
-        
-        # Get the current user
-        user = self.request.user
-
-        # Filter by role
-        if user.role == Role.CHW:
-            if hasattr(user, 'chw_assigned') and user.chw_assigned:
-                queryset = queryset.filter(community_work=user.chw_assigned)
-            else:
-                raise Http404("No CommunityWork assigned to this user.")
-        
-        elif user.role == Role.HEALTH_FACILITY:
-            if hasattr(user, 'health_facility_assigned') and user.health_facility_assigned:
-                queryset = queryset.filter(health_facility=user.health_facility_assigned)
-            else:
-                raise Http404("No HealthFacility assigned to this user.")
-        
-        elif user.role == Role.HOSPITAL:
-            # If the role is hospital, we filter by hospital
-            if hasattr(user, 'health_facility_assigned') and user.health_facility_assigned:
-                queryset = queryset.filter(health_facility=user.health_facility_assigned)
-            else:
-                raise Http404("No HealthFacility assigned to this user.")
-        
-        # Allow admins to see all data
-        elif user.role == Role.ADMIN or user.is_superuser:
-            queryset = queryset.all()
-        
-        else:
-            raise Http404("Unauthorized role.")
-        
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
         return queryset
 
+    def dispatch(self, request, *args, **kwargs):
+        mode = getattr(settings, 'QUERY_BUDGET_CHECK', '')
+        if self.query_budget is None or not mode:
+            return super().dispatch(request, *args, **kwargs)
+
+        queries = []
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count))
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+
+        if len(queries) > self.query_budget:
+            message = f"{type(self).__name__} ran {len(queries)} queries, its budget is {self.query_budget}"
+            if mode == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+def _int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class DataTablesMixin:
+    """
+    Answers the DataTables server-side protocol from a ListView: a GET with
+    ``draw`` gets one JSON page of ``get_queryset()`` (role filters included)
+    searched, sorted and sliced in the database. When the client sends the
+    ``after`` cursor of the previous page, the next one is read with a keyset
+    condition instead of OFFSET so deep pages cost the same as the first.
+
+    A draw runs at most one COUNT: the client sends back the total it was
+    given (``total``), and the filtered count is only taken for a search.
+    """
+    datatable_columns = ()  # (data key, ORM path) of the table's columns
+    datatable_orderable = ('id',)  # data keys the table sorts on, each backed by an index
+    datatable_search = ()  # ORM paths matched on prefix by the search box
+    datatable_max_length = 100
+    datatable_query_budget = 3
+
+    def get(self, request, *args, **kwargs):
+        if 'draw' not in request.GET:
+            return super().get(request, *args, **kwargs)
+        if self.query_budget is not None:
+            self.query_budget = self.datatable_query_budget
+        return JsonResponse(self.get_datatable_page(request.GET))
+
+    def get_datatable_page(self, params):
+        queryset = self.get_queryset()
+        total = _int(params.get('total'), -1)
+        if total < 0:
+            total = estimated_count(queryset)
+        filtered = total
+
+        search = params.get('search[value]', '').strip()
+        if search:
+            queryset = self.datatable_filter(queryset, search)
+            filtered = queryset.count()
+
+        columns = dict(self.datatable_columns)
+        key = params.get(f'columns[{_int(params.get("order[0][column]"), -1)}][data]')
+        path = columns[key] if key in self.datatable_orderable else 'id'
+        direction = '' if params.get('order[0][dir]') == 'asc' else '-'
+        ordering = [direction + 'id'] if path == 'id' else [direction + path, direction + 'id']
+        queryset = queryset.order_by(*ordering)
+
+        length = _int(params.get('length'), 10)
+        if not 0 < length <= self.datatable_max_length:
+            length = self.datatable_max_length
+        after = decode_cursor(params.get('after'))
+        page = keyset_filter(queryset, ordering, after) if after else None
+        if page is None:
+            start = max(_int(params.get('start'), 0), 0)
+            page = queryset[start:start + length]
+        else:
+            page = page[:length]
+
+        rows = list(page.values(*{*columns.values(), *(field.lstrip('-') for field in ordering)}))
+        return {
+            'draw': _int(params.get('draw'), 0),
+            'recordsTotal': total,
+            'recordsFiltered': filtered,
+            'data': [{key: row[path] for key, path in self.datatable_columns} for row in rows],
+            'cursor': encode_cursor(cursor_values(rows[-1], ordering)) if rows else None,
+        }
+
+    def datatable_filter(self, queryset, search):
+        condition = Q()
+        for path in self.datatable_search:
+            condition |= Q(**{f'{path}__istartswith': search})
+        if search.lstrip('#').isdigit():
+            condition |= Q(pk=int(search.lstrip('#')))
+        return queryset.filter(condition)
+
+
+class CursorPaginationMixin:
+    """
+    Replaces OFFSET pagination with CursorPaginator: pages follow the view's
+    ordering (made unique with the id) and are addressed by ?cursor=.
+    """
+    ordering = ['-id']
+    estimate_count = False
+
+    def paginate_queryset(self, queryset, page_size):
+        ordering = list(self.get_ordering())
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering.append('-id')
+        paginator = CursorPaginator(queryset, page_size, ordering, estimate_count=self.estimate_count)
+        page = paginator.page(self.request.GET.get('cursor'))
+        return (paginator, page, page.object_list, page.has_other_pages())
 
-class UserListView(RoleRequiredMixin, RoleBasedQuerysetMixin, ListView):
+
+class RoleBasedQuerysetMixin:
+    """
+    Mixin to filter objects based on the user's role, through the fields naming
+    the CHW and the facility, or through PatientAccess when ``scope_patient``
+    names the patient.
+    """
+    scope_community_work = 'community_work'
+    scope_health_facility = 'health_facility'
+    scope_patient = None
+
+    def get_queryset(self):
+        if self.scope_patient:
+            return self.request.scope.filter_patients(super().get_queryset(), self.scope_patient)
+        return self.request.scope.filter(
+            super().get_queryset(), self.scope_community_work, self.scope_health_facility,
+        )
+
+
+class UserListView(ReplicaReadMixin, RoleRequiredMixin, RoleBasedQuerysetMixin, CursorPaginationMixin, QueryBudgetMixin, ListView):
     allowed_roles = [Role.ADMIN, Role.HEALTH_FACILITY, Role.HOSPITAL]
     model = User
     template_name = 'main/users.html'
     context_object_name = 'users'
     paginate_by = 10
+    query_budget = 2
+    scope_community_work = 'chw_assigned'
+    scope_health_facility = 'health_facility_assigned'
 
 
 class CustomLoginView(SuccessMessageMixin, LoginView):
@@ -133,72 +294,116 @@ class LogoutView(View):
         logout(request)
         return redirect("login")
 
-class HomeView(TemplateView):
+class HomeView(ReplicaReadMixin, QueryBudgetMixin, TemplateView):
     #removed role required mixing because of too many redirects
     # allowed_roles = [Role.ADMIN, Role.CHW, Role.HEALTH_FACILITY, Role.HOSPITAL]
     allowed_roles = []
     template_name = 'main/index.html'
+    query_budget = 6  # counters, recent transfers and visits, and the user's scope
 
     def get_context_data(self, **kwargs):
-        user = self.request.user
+        scope = self.request.scope
         context_data =  super().get_context_data(**kwargs)
-        if user.role == Role.CHW:
-            context_data['recent_transfers'] = Transfer.objects.filter(visit__community_work=user.chw_assigned)[:4]
-            context_data['recent_patients'] = Visit.objects.filter(community_work=user.chw_assigned)[:4]
-
-
-            context_data['total_transfer'] = Transfer.objects.filter(visit__community_work=user.chw_assigned).count()
-            context_data['total_patient'] = Visit.objects.filter(community_work=user.chw_assigned).count()
-            context_data['today_patient'] = Visit.objects.filter(community_work=user.chw_assigned, date=timezone.now()).count()
+        transfers = Transfer.objects.select_related('visit__patient', 'from_health_facility', 'to_hospital').order_by('-id')
+        visits = Visit.objects.select_related('patient', 'health_facility', 'community_work').order_by('-id')
+        if scope.role == Role.CHW:
+            context_data['recent_transfers'] = transfers.filter(visit__community_work=scope.community_work_id)[:4]
+            context_data['recent_patients'] = visits.filter(community_work=scope.community_work_id)[:4]
+            context_data.update(dashboard(DashboardCounter.CHW, scope.community_work_id))
+
+        elif scope.is_facility:
+            context_data['recent_transfers'] = transfers.filter(from_health_facility=scope.health_facility_id)[:4]
+            context_data['recent_patients'] = visits.filter(health_facility=scope.health_facility_id)[:4]
+            context_data['is_hospital'] = scope.role == Role.HOSPITAL
+            context_data.update(dashboard(DashboardCounter.FACILITY, scope.health_facility_id))
 
-            context_data['visit_chart_data'] = chart_data(Visit.objects.filter(community_work=user.chw_assigned))
-
-        elif user.role == Role.HEALTH_FACILITY:
-            context_data['recent_transfers'] = Transfer.objects.filter(from_health_facility=user.health_facility_assigned)[:4]
-            context_data['recent_patients'] = Visit.objects.filter(health_facility=user.health_facility_assigned)[:4]
-
-            context_data['total_transfer'] = Transfer.objects.filter(from_health_facility=user.health_facility_assigned).count()
-            context_data['total_patient'] = Visit.objects.filter(health_facility=user.health_facility_assigned).count()
-            context_data['today_patient'] = Visit.objects.filter(health_facility=user.health_facility_assigned, date=timezone.now()).count()
-
-            context_data['visit_chart_data'] = chart_data(Visit.objects.filter(health_facility=user.health_facility_assigned))
-
-        elif user.role == Role.HOSPITAL:
-            context_data['recent_transfers'] = Transfer.objects.filter(from_health_facility=user.health_facility_assigned)[:4]
-            context_data['recent_patients'] = Visit.objects.filter(health_facility=user.health_facility_assigned)[:4]
-            context_data['is_hospital'] = True
-
-
-            context_data['total_transfer'] = Transfer.objects.filter(from_health_facility=user.health_facility_assigned).count()
-            context_data['total_patient'] = Visit.objects.filter(health_facility=user.health_facility_assigned).count()
-            context_data['today_patient'] = Visit.objects.filter(health_facility=user.health_facility_assigned, date=timezone.now()).count()
-
-            context_data['visit_chart_data'] = chart_data(Visit.objects.filter(health_facility=user.health_facility_assigned))
         else:
-            context_data['recent_transfers'] = Transfer.objects.all()[:4]
-            context_data['recent_patients'] = Visit.objects.all()[:4]
+            context_data['recent_transfers'] = transfers[:4]
+            context_data['recent_patients'] = visits[:4]
+            context_data.update(dashboard(DashboardCounter.NATIONAL))
+        return context_data
 
-            context_data['total_transfer'] = Transfer.objects.all().count()
-            context_data['total_patient'] = Visit.objects.all().count()
-            context_data['today_patient'] = Visit.objects.filter(date=timezone.now()).count()
+class VisitAnalyticsView(ReplicaReadMixin, RoleRequiredMixin, View):
+    """
+    Visit trends for the dashboard charts, read from the daily rollups.
+    ?start=2024-01-01&end=2024-03-31&freq=W&group_by=status,classification
+    """
+    allowed_roles = [Role.ADMIN, Role.CHW, Role.HEALTH_FACILITY, Role.HOSPITAL]
 
-            context_data['visit_chart_data'] = chart_data(Visit.objects.all())
-            print("----------------------------")
-            print(context_data['visit_chart_data'])
-        return context_data
+    def get(self, request, *args, **kwargs):
+        scope = request.scope
+        filters = {}
+        for name in ('facility', 'chw', 'district', 'classification', 'status'):
+            if request.GET.get(name):
+                filters[name] = request.GET[name]
+        if scope.role == Role.CHW:
+            filters['chw'] = scope.community_work_id or 0
+        elif scope.is_facility:
+            filters['facility'] = scope.health_facility_id or 0
+
+        try:
+            start = request.GET.get('start') and datetime.date.fromisoformat(request.GET['start'])
+            end = request.GET.get('end') and datetime.date.fromisoformat(request.GET['end'])
+            group_by = [name for name in request.GET.get('group_by', '').split(',') if name]
+            freq = request.GET.get('freq', 'D').upper()
+            trends = analytics.visit_trends(start or None, end or None, freq, group_by, **filters)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        trends['period'] = trends['period'].map(lambda period: period.date().isoformat())
+        rows = json.loads(trends.to_json(orient='records'))
+        return JsonResponse({'freq': freq, 'group_by': group_by, 'rows': rows})
+
+class TransferAnalyticsView(ReplicaReadMixin, RoleRequiredMixin, View):
+    """
+    Transfer delays in hours (count, median, p90, p99) per route or per week.
+    ?by=route|week&start=2024-01-01&end=2024-03-31
+    """
+    allowed_roles = [Role.ADMIN, Role.CHW, Role.HEALTH_FACILITY, Role.HOSPITAL]
 
-class AppointmentView(RoleRequiredMixin, ListView):
+    def get(self, request, *args, **kwargs):
+        scope = request.scope
+        filters = {}
+        if scope.role == Role.CHW:
+            filters['visit__community_work'] = scope.community_work_id
+        elif scope.role == Role.HEALTH_FACILITY:
+            filters['from_health_facility'] = scope.health_facility_id
+        elif scope.role == Role.HOSPITAL:
+            filters['to_hospital'] = scope.health_facility_id
+
+        by = request.GET.get('by', 'route')
+        try:
+            start = request.GET.get('start') and datetime.date.fromisoformat(request.GET['start'])
+            end = request.GET.get('end') and datetime.date.fromisoformat(request.GET['end'])
+            stats = analytics.transfer_delay_stats(by, start or None, end or None, **filters)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse({'by': by, 'rows': stats})
+
+class AppointmentView(ReplicaReadMixin, RoleRequiredMixin, DataTablesMixin, QueryBudgetMixin, ListView):
     allowed_roles = [Role.ADMIN, Role.HEALTH_FACILITY, Role.HOSPITAL]
     model = Appointment
     template_name = 'main/appointments.html'
     context_object_name = 'appointments'
+    paginate_by = 10
+    ordering = ['-id']
+    select_related = ('patient__patient',)
+    query_budget = 2
+    datatable_columns = (
+        ('id', 'id'),
+        ('first_name', 'patient__patient__first_name'),
+        ('last_name', 'patient__patient__last_name'),
+        ('appointment_date', 'appointment_date'),
+        ('appointment_time', 'appointment_time'),
+        ('arrived_at', 'arrived_at'),
+    )
+    datatable_orderable = ('id', 'appointment_date')
+    datatable_search = ('patient__patient__first_name', 'patient__patient__last_name')
 
     def get_queryset(self):
-        query_set = super().get_queryset()
-        if self.request.user.role == Role.CHW:
-            query_set = query_set.filter(patient__community_work=self.request.user.chw_assigned)
-        elif self.request.user.role == Role.HEALTH_FACILITY:
-            query_set = query_set.filter(patient__health_facility=self.request.user.health_facility_assigned)
+        query_set = self.request.scope.filter_patients(super().get_queryset(), 'patient__patient')
+        if self.request.GET.get('overdue'):
+            query_set = query_set.filter(missed=True)
         return query_set
 
 class AddAppointmentView(RoleRequiredMixin, TemplateView):
@@ -212,35 +417,102 @@ class AddPatientView(RoleRequiredMixin, SuccessMessageMixin, CreateView):
     success_url = reverse_lazy("patients")
     success_message = "patient Created successfully"
 
-    def form_valid(self, form):
-        # Custom logic here
-        try:
-            obj = Patient.objects.filter(identity=form.instance.identiy).first()
-        except:
-            obj = None
-            print("object not found")
-        if obj == None:
-            form.instance.health_facility = self.request.user.health_facility_assigned
-            send_sms('+250783378349', "Thanks for coming to our health center. your Information was recorded successfully")
-            anc_send_email(form.instance.email, "Thanks for coming to our health center. your Information was recorded successfully")
-        else:
-            return redirect('patient-detail', pk=obj.pk)
-        return super().form_valid(form)
-
+    def form_invalid(self, form):
+        # a returning mother: the national ID is already registered
+        patient = 'identity' in form.errors and matching.identity_match(form.data.get('identity'))
+        if patient:
+            messages.info(self.request, f"{patient} is already registered")
+            return redirect('patient-detail', pk=patient.pk)
+        return super().form_invalid(form)
 
-class PatientView(RoleRequiredMixin, RoleBasedQuerysetMixin, ListView):
+    def form_valid(self, form):
+        if not form.cleaned_data.get('confirm_new'):
+            matches = matching.candidates(
+                form.cleaned_data['first_name'], form.cleaned_data['last_name'], form.cleaned_data.get('phone_number'),
+            )
+            if matches:
+                return self.render_to_response(self.get_context_data(form=form, matches=matches))
+        form.instance.health_facility_id = self.request.scope.health_facility_id
+        with transaction.atomic():
+            response = super().form_valid(form)
+            queue_sms(form.instance.phone_number, "Thanks for coming to our health center. your Information was recorded successfully")
+            queue_email(form.instance.email, "Thanks for coming to our health center. your Information was recorded successfully")
+        return response
+
+
+class PatientView(ReplicaReadMixin, RoleRequiredMixin, RoleBasedQuerysetMixin, DataTablesMixin, CursorPaginationMixin, QueryBudgetMixin, ListView):
     
     allowed_roles = [Role.ADMIN, Role.HEALTH_FACILITY, Role.HOSPITAL]
     model = Patient
     template_name = 'main/patient.html'
     paginate_by = 10
     context_object_name = 'patients'
+    select_related = ('sector', 'cell')
+    estimate_count = True
+    query_budget = 2
+    datatable_columns = (
+        ('id', 'id'),
+        ('first_name', 'first_name'),
+        ('last_name', 'last_name'),
+        ('sector', 'sector__name'),
+        ('cell', 'cell__name'),
+        ('phone_number', 'phone_number'),
+    )
+    datatable_orderable = ('id', 'first_name', 'last_name')
+    datatable_search = ('first_name', 'last_name', 'phone_number', 'identity')
+    datatable_query_budget = 4  # plus the search index lookup
+    scope_patient = 'pk'
+
+    def datatable_filter(self, queryset, search):
+        # the search index, limited to what one DataTables request can page through
+        ids = search_backend().search(search, membership=self.request.scope.membership, limit=1000)
+        return queryset.filter(pk__in=ids)
+
+
+class PatientSearchView(ReplicaReadMixin, RoleRequiredMixin, RoleBasedQuerysetMixin, ListView):
+    """Patients matching ?q= (names, ID, phone or village), best match first, as JSON"""
+    allowed_roles = [Role.ADMIN, Role.HEALTH_FACILITY, Role.HOSPITAL]
+    model = Patient
+    scope_patient = 'pk'
 
-class CurrentVisit(RoleRequiredMixin, RoleBasedQuerysetMixin, ListView):
+    def get(self, request, *args, **kwargs):
+        limit = min(max(_int(request.GET.get('limit'), 20), 1), 100)
+        queryset = self.get_queryset().select_related('village')
+        patients = search_patients(queryset, request.GET.get('q', ''), request.scope.membership, limit)
+        return JsonResponse({'results': [
+            {
+                'id': patient.pk,
+                'first_name': patient.first_name,
+                'middle_name': patient.middle_name,
+                'last_name': patient.last_name,
+                'identity': patient.identity,
+                'phone_number': patient.phone_number,
+                'village': patient.village.name if patient.village else None,
+                'url': patient.get_absolute_url(),
+            }
+            for patient in patients
+        ]})
+
+class CurrentVisit(ReplicaReadMixin, RoleRequiredMixin, RoleBasedQuerysetMixin, DataTablesMixin, QueryBudgetMixin, ListView):
     allowed_roles = [Role.ADMIN, Role.CHW, Role.HEALTH_FACILITY, Role.HOSPITAL]
     model = Visit
     template_name = 'main/current-visits.html'
     context_object_name = 'current_visits'
+    paginate_by = 10
+    ordering = ['-id']
+    select_related = ('patient', 'community_work')
+    query_budget = 2
+    datatable_columns = (
+        ('id', 'id'),
+        ('first_name', 'patient__first_name'),
+        ('last_name', 'patient__last_name'),
+        ('community_work', 'community_work__first_name'),
+        ('date', 'date'),
+        ('is_transferred', 'is_transferred'),
+        ('diagnize_classification', 'diagnize_classification'),
+    )
+    datatable_orderable = ('id', 'date')
+    datatable_search = ('patient__first_name', 'patient__last_name', 'community_work__first_name')
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -248,11 +520,13 @@ class CurrentVisit(RoleRequiredMixin, RoleBasedQuerysetMixin, ListView):
         return qs
     
 
-class PatientDetail(RoleRequiredMixin, DetailView):
+class PatientDetail(RoleRequiredMixin, QueryBudgetMixin, DetailView):
     allowed_roles = [Role.ADMIN, Role.CHW, Role.HEALTH_FACILITY, Role.HOSPITAL]
     model = Patient
     template_name = 'main/patient-detail.html'
     context_object_name = 'patient'
+    select_related = ('district', 'sector', 'cell', 'village')
+    query_budget = 8
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -267,14 +541,14 @@ class PatientDetail(RoleRequiredMixin, DetailView):
         if form.is_valid():
             visit = form.save(commit=False)
             visit.patient = self.object
-            visit.save()
-            try:
-                send_sms('+250783378349', f"{visit.patient.first_name} You have been accepted by ANC Tracker ")
-                anc_send_email(visit.to_hospital.email, "Thanks for coming to our health center. your Visit Information was recorded successfully")
-                anc_send_email(visit.patient.email, "Thanks for coming to our health center. your Information was recorded successfully")
-                anc_send_email(visit.community_work.email, "Thanks for coming to our health center. your Information was recorded successfully")
-            except:
-                print("failed to send email or sms")
+            with transaction.atomic():
+                visit.save()
+                queue_sms(visit.patient.phone_number, f"{visit.patient.first_name} You have been accepted by ANC Tracker ")
+                if visit.health_facility:
+                    queue_email(visit.health_facility.email, "Thanks for coming to our health center. your Visit Information was recorded successfully")
+                queue_email(visit.patient.email, "Thanks for coming to our health center. your Information was recorded successfully")
+                if visit.community_work:
+                    queue_email(visit.community_work.email, "Thanks for coming to our health center. your Information was recorded successfully")
             messages.success(request, "Visit saved successfully!")
             return HttpResponseRedirect(reverse('current-visits'))
         else:
@@ -282,11 +556,82 @@ class PatientDetail(RoleRequiredMixin, DetailView):
             context['form'] = form  # Pass the invalid form back to the template
             return self.render_to_response(context)
     
-class CurrentVisitDetail(RoleRequiredMixin, DetailView):
+class AutocompleteView(ReplicaReadMixin, RoleRequiredMixin, View):
+    """
+    One page of options for an AutocompleteSelect, in the Select2 format:
+    {"results": [{"id": 1, "text": "..."}], "pagination": {"more": true}}
+    ?term= is matched on indexed prefixes, ?page= starts at 1.
+    """
+    allowed_roles = [Role.ADMIN, Role.CHW, Role.HEALTH_FACILITY, Role.HOSPITAL]
+    page_size = 20
+
+    def get(self, request, source, *args, **kwargs):
+        if source not in AUTOCOMPLETE_SOURCES:
+            raise Http404("Unknown autocomplete source")
+        find, label = AUTOCOMPLETE_SOURCES[source]
+        page = max(_int(request.GET.get('page'), 1), 1)
+        objects = find(
+            request.scope, request.GET.get('term', '').strip(), (page - 1) * self.page_size, self.page_size + 1,
+            status=request.GET.get('status'),
+        )
+        return JsonResponse({
+            'results': [{'id': obj.pk, 'text': label(obj)} for obj in objects[:self.page_size]],
+            'pagination': {'more': len(objects) > self.page_size},
+        })
+
+
+class VisitBatchView(RoleRequiredMixin, TemplateView):
+    """
+    Enter the visits of an outreach day at once, from the form or as JSON:
+    POST {"visits": [{"patient": 1, "disease": "...", "weight": 60, "bmi": 22, "diagnize_classification": "green"}, ...]}
+    """
+    allowed_roles = [Role.ADMIN, Role.CHW, Role.HEALTH_FACILITY]
+    template_name = 'main/visit-batch.html'
+
+    def get_formset(self, data=None):
+        scope = self.request.scope
+        kwargs = {}
+        if scope.role == Role.CHW:
+            kwargs['community_work'] = scope.community_work_id
+        elif scope.role == Role.HEALTH_FACILITY:
+            kwargs['health_facility'] = scope.health_facility_id
+        return VisitBatchFormSet(data, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        kwargs.setdefault('formset', self.get_formset())
+        return super().get_context_data(**kwargs)
+
+    def post(self, request, *args, **kwargs):
+        if request.content_type == 'application/json':
+            return self.post_json(request)
+        formset = self.get_formset(request.POST)
+        if not formset.is_valid():
+            return self.render_to_response(self.get_context_data(formset=formset))
+        visits = create_visits(formset.visits())
+        messages.success(request, f"{len(visits)} visits saved successfully!")
+        return HttpResponseRedirect(reverse('current-visits'))
+
+    def post_json(self, request):
+        try:
+            rows = json.loads(request.body)['visits']
+            data = {'form-TOTAL_FORMS': len(rows), 'form-INITIAL_FORMS': 0}
+            for i, row in enumerate(rows):
+                data.update({f'form-{i}-{name}': value for name, value in row.items()})
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return JsonResponse({'error': 'Expected {"visits": [...]}'}, status=400)
+        formset = self.get_formset(data)
+        if not formset.is_valid():
+            return JsonResponse({'errors': formset.errors, 'non_form_errors': formset.non_form_errors()}, status=400)
+        visits = create_visits(formset.visits())
+        return JsonResponse({'created': [visit.pk for visit in visits]}, status=201)
+
+
+class CurrentVisitDetail(RoleRequiredMixin, QueryBudgetMixin, DetailView):
     allowed_roles = [Role.ADMIN, Role.CHW, Role.HEALTH_FACILITY, Role.HOSPITAL]
     model = Visit
     template_name = 'main/current-visit-detail.html'
     context_object_name = 'visit'
+    query_budget = 2
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -298,51 +643,69 @@ def transfer_patient(request, id):
         visit = get_object_or_404(Visit, id=id)
         hospital_id = int(request.POST.get("hospital"))
         hospital = HealthFacility.objects.get(id=hospital_id)
-        transfer = Transfer.objects.create(
-            visit=visit,
-            from_health_facility=visit.health_facility,
-            to_hospital=hospital,
-        )
-        transfer.save()
-        visit.is_transferred = True
-        visit.save()
-        try:
-            send_sms('+250783378349', f"You have been transfered to {transfer.to_hospital.name}")
-            anc_send_email(transfer.to_hospital.email, "Thanks for coming to our health center. your Information was recorded successfully")
-            anc_send_email(transfer.visit.patient.email, "Thanks for coming to our health center. your Information was recorded successfully")
-            anc_send_email(transfer.visit.community_work.email, "Thanks for coming to our health center. your Information was recorded successfully")
-        except:
-            print("failed to send email or sms")
+        with transaction.atomic():
+            transfer = Transfer.objects.create(
+                visit=visit,
+                from_health_facility=visit.health_facility,
+                to_hospital=hospital,
+            )
+            visit.is_transferred = True
+            visit.save()
+            queue_sms(visit.patient.phone_number, f"You have been transfered to {transfer.to_hospital.name}")
+            queue_email(transfer.to_hospital.email, "Thanks for coming to our health center. your Information was recorded successfully")
+            queue_email(visit.patient.email, "Thanks for coming to our health center. your Information was recorded successfully")
+            if visit.community_work:
+                queue_email(visit.community_work.email, "Thanks for coming to our health center. your Information was recorded successfully")
         return redirect('transfers')
     else:
         return redirect('current-visits')
     
 
-class TransferView(RoleRequiredMixin, ListView):
+class TransferView(ReplicaReadMixin, RoleRequiredMixin, DataTablesMixin, CursorPaginationMixin, QueryBudgetMixin, ListView):
     allowed_roles = [Role.ADMIN, Role.CHW, Role.HEALTH_FACILITY, Role.HOSPITAL]
     model = Transfer
     template_name = 'main/transfers.html'
     context_object_name = 'patients_transfered'
     paginate_by = 10
+    select_related = ('visit__patient', 'from_health_facility', 'to_hospital')
+    estimate_count = True
+    query_budget = 2
+    datatable_columns = (
+        ('id', 'id'),
+        ('first_name', 'visit__patient__first_name'),
+        ('last_name', 'visit__patient__last_name'),
+        ('from_health_facility', 'from_health_facility__name'),
+        ('to_hospital', 'to_hospital__name'),
+        ('transfer_date', 'transfer_date'),
+        ('patient_arrived_at', 'patient_arrived_at'),
+        ('delay_in_hours', 'delay_in_hours'),
+    )
+    datatable_orderable = ('id', 'transfer_date')
+    datatable_search = ('visit__patient__first_name', 'visit__patient__last_name', 'to_hospital__name')
 
     def get_queryset(self):
         query_set = super().get_queryset()
-        if self.request.user.role == Role.CHW:
-            query_set = query_set.filter(visit__community_work=self.request.user.chw_assigned)
-        elif self.request.user.role == Role.HEALTH_FACILITY:
-            query_set = query_set.filter(from_health_facility=self.request.user.health_facility_assigned)
-        elif self.request.user.role == Role.HOSPITAL:
-            query_set = query_set.filter(to_hospital=self.request.user.health_facility_assigned)
+        scope = self.request.scope
+        if scope.role == Role.CHW:
+            query_set = query_set.filter(visit__community_work=scope.community_work_id)
+        elif scope.role == Role.HEALTH_FACILITY:
+            query_set = query_set.filter(from_health_facility=scope.health_facility_id)
+        elif scope.role == Role.HOSPITAL:
+            query_set = query_set.filter(to_hospital=scope.health_facility_id)
+        if self.request.GET.get('overdue'):
+            query_set = query_set.filter(overdue=True)
 
         return query_set
 
 
-class DoctorsView(RoleRequiredMixin, RoleBasedQuerysetMixin, ListView):
+class DoctorsView(ReplicaReadMixin, RoleRequiredMixin, RoleBasedQuerysetMixin, CursorPaginationMixin, QueryBudgetMixin, ListView):
     allowed_roles = [Role.ADMIN, Role.HEALTH_FACILITY, Role.HOSPITAL]
     model = Doctor
     template_name = 'main/doctors.html'
     context_object_name = 'doctors'
     paginate_by = 10
+    select_related = ('health_facility',)
+    query_budget = 2
     
 
 class DoctorDetailView(RoleRequiredMixin, TemplateView):
@@ -371,19 +734,24 @@ class AddHealthFacilityView(RoleRequiredMixin, SuccessMessageMixin, CreateView):
     success_url = reverse_lazy("health-facilities")
     success_message = "Health Facility Created successfully"
 
-class CommunityWork(RoleRequiredMixin, RoleBasedQuerysetMixin, ListView):
+class CommunityWork(ReplicaReadMixin, RoleRequiredMixin, RoleBasedQuerysetMixin, CursorPaginationMixin, QueryBudgetMixin, ListView):
     allowed_roles = [Role.ADMIN,Role.HEALTH_FACILITY]
     model = CommunityWork
     template_name = 'main/community-work-list.html'
     context_object_name = 'community_workers'
     paginate_by = 10
+    select_related = ('district', 'sector', 'cell', 'health_facility')
+    query_budget = 2
 
-class HealthFacilityView(RoleRequiredMixin, ListView):
+class HealthFacilityView(ReplicaReadMixin, RoleRequiredMixin, QueryBudgetMixin, ListView):
     allowed_roles = [Role.ADMIN]
     model = HealthFacility
     template_name = 'main/health-facilities.html'
     context_object_name = 'health_facilities'
     paginate_by = 10
+    ordering = ['-id']
+    select_related = ('district', 'sector', 'cell')
+    query_budget = 2
 
 class HealthFacilityDetailView(RoleRequiredMixin, TemplateView):
     allowed_roles = [Role.ADMIN, Role.HEALTH_FACILITY, Role.HOSPITAL]
@@ -408,7 +776,8 @@ def confirm_arrival(request, pk):
     transfer_obj = get_object_or_404(Transfer, id=pk)
     if transfer_obj:
         transfer_obj.patient_arrived_at = timezone.now()
-        transfer_obj.save()
+        transfer_obj.overdue = False
+        transfer_obj.calculate_delay()
         messages.success(request, f'{transfer_obj.visit.patient} arrival confirmed successfully')
         return redirect('transfers')
     else:
@@ -419,31 +788,18 @@ def confirm_arrival(request, pk):
 ##########
 ############
 
+def _location_options(request, level, parent):
+    html, etag = get_tree().options(level, request.GET.get(parent))
+    response = HttpResponse(html)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return get_conditional_response(request, etag=etag, response=response)
+
 def load_drop_downs(request):
-    id = request.GET.get("district")
-    # model_str = 
-    context = {
-        "items": Sector.objects.filter(district=id)
-    }
-    return render(request, 'htmx/location_dropdown.html', context)
+    return _location_options(request, 'sector', 'district')
 
 def load_cell_drop_downs(request):
-    id = request.GET.get("sector")
-    # model_str = 
-    context = {
-        "items": Cell.objects.filter(sector=id)
-    }
-    return render(request, 'htmx/location_dropdown.html', context)
+    return _location_options(request, 'cell', 'sector')
 
 def load_village_drop_downs(request):
-    id = request.GET.get("cell")
-    # model_str = 
-    context = {
-        "items": Village.objects.filter(cell=id)
-    }
-    return render(request, 'htmx/location_dropdown.html', context)
-
-
-
-
-
+    return _location_options(request, 'village', 'cell')
@@ -0,0 +1,50 @@
+from django.db import transaction
+
+from . import analytics, dashboard, membership
+from .models import Notification, Visit
+from .notifications import queue_many
+from .send_mail import SUBJECT
+
+
+def batch_notifications(visits):
+    """What saving ``visits`` one by one would have sent, with one summary per facility and CHW"""
+    notifications = []
+    patients = {visit.patient_id: visit.patient for visit in visits}
+    for patient in patients.values():
+        if patient.phone_number:
+            notifications.append(Notification(
+                channel=Notification.SMS, recipient=patient.phone_number,
+                body=f"{patient.first_name} You have been accepted by ANC Tracker",
+            ))
+        if patient.email:
+            notifications.append(Notification(
+                channel=Notification.EMAIL, recipient=patient.email, subject=SUBJECT,
+                body="Thanks for coming to our health center. your Information was recorded successfully",
+            ))
+    contacts = {}
+    for visit in visits:
+        for contact in (visit.health_facility, visit.community_work):
+            if contact is not None and contact.email:
+                contacts.setdefault(contact.email, []).append(visit)
+    for email, recorded in contacts.items():
+        names = "\n".join(f"{visit.patient.first_name} {visit.patient.last_name}" for visit in recorded)
+        notifications.append(Notification(
+            channel=Notification.EMAIL, recipient=email, subject=SUBJECT,
+            body=f"{len(recorded)} visits were recorded:\n\n{names}",
+        ))
+    return notifications
+
+
+@transaction.atomic
+def create_visits(visits):
+    """
+    Insert a batch of unsaved visits with one bulk_create. bulk_create sends
+    no signals, so the dashboard counters, rollups and patient access the
+    signals would have updated are updated here, once for the batch.
+    """
+    visits = Visit.objects.bulk_create(visits)
+    dashboard.record_visits(visits)
+    analytics.record_visits(visits)
+    membership.grant_visits(visits)
+    queue_many(batch_notifications(visits))
+    return visits
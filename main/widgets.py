@@ -0,0 +1,27 @@
+from django import forms
+
+
+class AutocompleteSelect(forms.Select):
+    """
+    A select that renders only its selected option instead of the whole
+    table; static/js/autocomplete.js loads the others from ``url`` (an
+    /autocomplete/<source>/ endpoint) as the user types. ``queryset`` and
+    ``label`` are needed when the field is not a ModelChoiceField.
+    """
+
+    def __init__(self, url, attrs=None, queryset=None, label=None):
+        super().__init__({**(attrs or {}), 'data-autocomplete-url': url})
+        self.url = url
+        self.queryset = queryset
+        self.label = label
+
+    def optgroups(self, name, value, attrs=None):
+        selected = [v for v in value if str(v).isdigit()]
+        options = [self.create_option(name, '', '---------', not selected, 0)]
+        if selected:
+            field = getattr(self.choices, 'field', None)
+            queryset = self.queryset if self.queryset is not None else self.choices.queryset
+            label = self.label or (field.label_from_instance if field else str)
+            for index, obj in enumerate(queryset.filter(pk__in=selected), 1):
+                options.append(self.create_option(name, obj.pk, label(obj), True, index))
+        return [(None, options, 0)]
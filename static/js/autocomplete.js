@@ -0,0 +1,83 @@
+// On-demand options for <select data-autocomplete-url> (main.widgets.AutocompleteSelect).
+// A search box is put in front of each select; what is typed is sent to the
+// autocomplete endpoint and the select is refilled with one page of matches.
+(function () {
+	var timers = new WeakMap();
+
+	function searchBox(select) {
+		var input = document.createElement('input');
+		input.type = 'search';
+		input.className = 'form-control mb-5';
+		input.placeholder = 'Type to search...';
+		input.setAttribute('data-autocomplete-search', '');
+		input.autocomplete = 'off';
+		select.parentNode.insertBefore(input, select);
+	}
+
+	function option(value, text, more) {
+		var element = document.createElement('option');
+		element.value = value;
+		element.textContent = text;
+		if (more) {
+			element.setAttribute('data-more', more);
+		}
+		return element;
+	}
+
+	function load(select, term, page) {
+		var url = select.getAttribute('data-autocomplete-url');
+		var query = '?term=' + encodeURIComponent(term) + '&page=' + page;
+		fetch(url + (url.indexOf('?') < 0 ? query : '&' + query.slice(1)), {credentials: 'same-origin'})
+			.then(function (response) { return response.json(); })
+			.then(function (json) {
+				if (page === 1) {
+					var selected = select.selectedOptions[0];
+					select.innerHTML = '';
+					select.appendChild(selected && selected.value ? selected : option('', '---------'));
+				} else {
+					select.querySelectorAll('option[data-more]').forEach(function (more) { more.remove(); });
+				}
+				json.results.forEach(function (result) {
+					if (!select.querySelector('option[value="' + result.id + '"]')) {
+						select.appendChild(option(result.id, result.text));
+					}
+				});
+				if (json.pagination && json.pagination.more) {
+					select.appendChild(option('', 'More results...', page + 1));
+				}
+				select.setAttribute('data-autocomplete-term', term);
+				select.size = Math.min(select.options.length, 8);
+			});
+	}
+
+	function target(input) {
+		var select = input.nextElementSibling;
+		return select && select.matches('select[data-autocomplete-url]') ? select : null;
+	}
+
+	document.addEventListener('input', function (event) {
+		var select = event.target.matches('[data-autocomplete-search]') && target(event.target);
+		if (!select) {
+			return;
+		}
+		clearTimeout(timers.get(select));
+		timers.set(select, setTimeout(function () { load(select, event.target.value.trim(), 1); }, 250));
+	});
+
+	document.addEventListener('change', function (event) {
+		var select = event.target;
+		if (!select.matches('select[data-autocomplete-url]')) {
+			return;
+		}
+		var more = select.selectedOptions[0] && select.selectedOptions[0].getAttribute('data-more');
+		if (more) {
+			load(select, select.getAttribute('data-autocomplete-term') || '', parseInt(more, 10));
+		} else {
+			select.size = 1;
+		}
+	});
+
+	document.addEventListener('DOMContentLoaded', function () {
+		document.querySelectorAll('select[data-autocomplete-url]').forEach(searchBox);
+	});
+})();
@@ -0,0 +1,65 @@
+// Fill the chained District -> Sector -> Cell -> Village dropdowns from the
+// cached location bundle instead of one HTMX request per change. Falls back
+// to the last bundle stored in localStorage when offline, and to the normal
+// HTMX requests when no bundle is available at all.
+(function () {
+	var STORAGE_KEY = 'anc-location-bundle';
+	var children = null;
+
+	function index(data) {
+		var tree = {sector: {}, cell: {}, village: {}};
+		[['sector', data.sectors], ['cell', data.cells], ['village', data.villages]].forEach(function (level) {
+			level[1].forEach(function (row) {
+				(tree[level[0]][row[2]] = tree[level[0]][row[2]] || []).push(row);
+			});
+		});
+		return tree;
+	}
+
+	function useStored() {
+		try {
+			var stored = localStorage.getItem(STORAGE_KEY);
+			if (stored) {
+				children = index(JSON.parse(stored));
+			}
+		} catch (e) {}
+	}
+
+	function load(url) {
+		fetch(url, {cache: 'no-cache', credentials: 'same-origin'})
+			.then(function (response) {
+				if (!response.ok) {
+					throw new Error(response.status);
+				}
+				return response.text();
+			})
+			.then(function (text) {
+				children = index(JSON.parse(text));
+				try {
+					localStorage.setItem(STORAGE_KEY, text);
+				} catch (e) {}
+			})
+			.catch(useStored);
+	}
+
+	document.addEventListener('htmx:beforeRequest', function (event) {
+		var source = event.detail.elt;
+		var target = event.detail.target;
+		if (!children || !target || !source.dataset.locationLevel || !children[target.dataset.locationLevel]) {
+			return;
+		}
+		event.preventDefault();
+		target.innerHTML = '';
+		target.add(new Option('--------', ''));
+		(children[target.dataset.locationLevel][source.value] || []).forEach(function (row) {
+			target.add(new Option(row[1], row[0]));
+		});
+	});
+
+	document.addEventListener('DOMContentLoaded', function () {
+		var select = document.querySelector('[data-location-bundle]');
+		if (select) {
+			load(select.dataset.locationBundle);
+		}
+	});
+})();
@@ -0,0 +1,48 @@
+// DataTables in server-side mode against the list view's own URL. The first
+// page is rendered by Django (deferLoading); when the user moves to the next
+// page with the same sort and search, the cursor of the current page is sent
+// along so the server reads it with a keyset query instead of OFFSET. The
+// total is counted once, for the first page, and sent back with every draw.
+function serverTable(selector, columns) {
+	var table = $(selector);
+	var cursors = {};
+	var last = null;
+	var total = parseInt(table.data('total'), 10) || 0;
+
+	function key(start, params) {
+		return JSON.stringify([start, params.length, params.order, params.search.value]);
+	}
+
+	return table.DataTable({
+		serverSide: true,
+		processing: true,
+		searchDelay: 400,
+		deferLoading: total,
+		order: [[0, 'desc']],
+		columns: columns,
+		ajax: {
+			// keep page filters such as ?overdue=1
+			url: window.location.pathname + window.location.search,
+			data: function (params) {
+				last = params;
+				params.total = total;
+				if (cursors[key(params.start, params)]) {
+					params.after = cursors[key(params.start, params)];
+				}
+			},
+			dataSrc: function (json) {
+				total = json.recordsTotal;
+				if (json.cursor) {
+					cursors[key(last.start + last.length, last)] = json.cursor;
+				}
+				return json.data;
+			}
+		}
+	});
+}
+
+function detailLink(url, label) {
+	return function (id) {
+		return '<a class="hover-primary" href="' + url.replace('/0/', '/' + id + '/') + '">' + label + '</a>';
+	};
+}